@@ -0,0 +1,48 @@
+"""Runtime settings for the HealMate agent.
+
+All environment variables used by the agent and its tools are read here, once, right
+after `.env` is loaded. Other modules import `settings` instead of calling `os.getenv`,
+so no setting can be read before `load_dotenv()` has run.
+"""
+
+import os
+from dataclasses import dataclass, field
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _env(name: str, default: Optional[str] = None) -> Optional[str]:
+    """Return the environment variable, treating an empty value as unset."""
+    return os.getenv(name) or default
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Immutable snapshot of the agent's environment configuration."""
+
+    # LLM
+    llm_provider: str = field(default_factory=lambda: _env("LLM_PROVIDER", "openai").lower())
+    openai_api_key: Optional[str] = field(default_factory=lambda: _env("OPENAI_API_KEY"))
+    deepseek_api_key: Optional[str] = field(default_factory=lambda: _env("DEEPSEEK_API_KEY"))
+
+    # Conversation memory
+    redis_url: Optional[str] = field(default_factory=lambda: _env("REDIS_URL"))
+    memory_ttl_seconds: int = 7 * 24 * 3600
+
+    # Tarot RAG
+    qdrant_url: Optional[str] = field(default_factory=lambda: _env("QDRANT_URL"))
+    qdrant_api_key: Optional[str] = field(default_factory=lambda: _env("QDRANT_API_KEY"))
+    tarot_embedder: str = field(default_factory=lambda: _env("TAROT_EMBEDDER", "ollama").lower())
+    fastembed_model: str = field(
+        default_factory=lambda: _env("FASTEMBED_MODEL", "nomic-ai/nomic-embed-text-v1.5-Q")
+    )
+    # Connect to Qdrant and load the embedder at startup instead of on the first tarot query
+    warmup_tarot_backends: bool = field(
+        default_factory=lambda: _env("WARMUP_TAROT_BACKENDS", "false").lower() in ("1", "true", "yes")
+    )
+
+
+settings = Settings()
@@ -4,58 +4,51 @@ This module initializes a conversational agent that uses a set of tools to inter
 The agent is responsible for understanding user intent, routing requests to the appropriate tool,
 and generating a coherent, empathetic, and helpful response.
 
-It leverages LangChain's agent framework, including tools, a language model, and memory,
-to create a flexible and powerful conversational experience.
+The agent loop is a small asyncio loop on top of the OpenAI-compatible DeepSeek API: it
+calls the model with the tool schemas, runs the requested tool calls concurrently and
+feeds the results back until the model answers. LangChain still provides the tools and
+the conversation memory.
 """
 
-import os
+import json
+import inspect
+import re
+import asyncio
 import logging
-from typing import Dict, Any, Optional, List
+from typing import AsyncIterator, Awaitable, Callable, Dict, Any, Optional, List, Tuple
 
-from langchain.agents import AgentExecutor, create_openai_tools_agent
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.language_models.llms import BaseLLM
-from langchain.memory import ConversationBufferWindowMemory
+from langchain.tools import Tool
+from langchain_community.chat_message_histories import RedisChatMessageHistory
+from langchain_core.messages import BaseMessage
 
-# 添加 DeepSeek LLM 支援
-from langchain_core.language_models.chat_models import BaseChatModel
-from langchain_deepseek.chat_models import ChatDeepSeek
+from core.cache import LRUCache
 
-from functools import partial
-from langchain.tools import Tool
+from .config import settings
+from .memory import ExpandingWindowMemory
+from .tools import strategy_tool, tarot_reading_tool, emotion_analysis_tool, random_tarot_reading_tool, horoscope_tool, knowledge_base_tool, mood_history_tool
+from .tools import aclient, get_qdrant_client, stream_chat_completion, stream_horoscope_reading, stream_random_tarot_reading, _embed_queries
 
-from .tools import strategy_tool, tarot_reading_tool, emotion_analysis_tool, random_tarot_reading_tool, horoscope_tool, knowledge_base_tool, _run_mood_history_tool
+logger = logging.getLogger(__name__)
 
 # --- Agent Initialization ---
 
-# 1. Define the base tools the agent can use (without user-specific context)
-base_tools = [strategy_tool, tarot_reading_tool, emotion_analysis_tool, random_tarot_reading_tool, horoscope_tool, knowledge_base_tool]
-
-# The mood_history_tool will be created dynamically per user request.
-
-# 2. 獲取環境變數
-LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai").lower()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
-
-# 3. 根據提供商選擇語言模型
-def get_llm() -> BaseChatModel:
-    """根據環境變數配置選擇 LLM 提供商"""
-    if not DEEPSEEK_API_KEY:
-        logging.error("DeepSeek API Key not provided. Cannot initialize DeepSeek LLM.")
-        raise ValueError("DEEPSEEK_API_KEY is required for DeepSeek LLM.")
-        
-    logging.info("Using DeepSeek LLM API v3")
-    return ChatDeepSeek(
-        api_key=DEEPSEEK_API_KEY,
-        model="deepseek-chat",  # 使用 DeepSeek Chat 模型
-        temperature=0.7,
-        streaming=True
-    )
+# 1. Define the tools the agent can use
+# The tools hold no user-specific state: the agent loop passes the current user_id
+# to MoodHistoryChecker, so one tool list serves every user.
+tools = [strategy_tool, tarot_reading_tool, emotion_analysis_tool, random_tarot_reading_tool, horoscope_tool, knowledge_base_tool, mood_history_tool]
 
-# 初始化 LLM
-llm = get_llm()
+# 2. 環境變數統一由 agents/config.py 的 settings 讀取
+
+# 3. 初始化 LLM
+# Agent 迴圈直接使用 tools 模組共用的 DeepSeek AsyncOpenAI client (HTTP/2 連線池)。
+if not settings.deepseek_api_key:
+    logging.error("DeepSeek API Key not provided. Cannot initialize DeepSeek LLM.")
+    raise ValueError("DEEPSEEK_API_KEY is required for DeepSeek LLM.")
+
+AGENT_MODEL = "deepseek-chat"
+AGENT_TEMPERATURE = 0.7
+# 與 AgentExecutor 預設相同的步數上限；最後一步不再允許呼叫工具，強制模型直接回答
+MAX_AGENT_STEPS = 15
 
 # 3. Define the System Prompt
 # This prompt is crucial for the agent's behavior. It tells the LLM how to act.
@@ -65,82 +58,273 @@ AGENT_SYSTEM_PROMPT = """你是一個名為「HealMate」的AI助理，是一個
 **個人化能力**: 你可以記住與使用者的對話。在提供建議前，你可以使用 `MoodHistoryChecker` 工具來查詢使用者的近期心情，以便提供更貼心、更有脈絡的回應。
 
 你可以使用以下工具來幫助你：
-- **StrategyAdvisor**: 當用戶需要具體建議或行動步驟時使用。
 - **TarotReader**: 當用戶想針對「特定問題」進行占卜，尋找與問題最相關的牌卡時使用。它會從牌庫中檢索最匹配的牌。
 - **RandomTarotReader**: 當用戶想要「隨機抽牌」、算「每日運勢」或尋求一個隨機指引時使用。它會模擬真實的抽牌過程。
 - **HoroscopeProvider**: 當用戶想要查詢特定星座的今日運勢時使用。如果用戶提到「白羊座」、「金牛座」等星座名稱並想了解運勢，就用這個工具。
-- **EmotionAnalyzer**: 當你想更深入了解用戶的情緒狀態時，可以在內部使用此工具來輔助你做決策。
 - **MoodHistoryChecker**: 在與使用者互動一段時間後，或當使用者提到「最近心情不好」等模糊的描述時，使用此工具來查詢他們最近的心情紀錄。這有助於你了解他們的長期情緒狀態。
+- **KnowledgeBaseTool**: 當用戶詢問一般知識或名詞解釋時使用。
+
+**情緒分析與建議由你直接完成**：當用戶抒發心情或詢問「我該怎麼辦？」時，請在同一次回覆中自行完成以下步驟，不要另外呼叫工具：
+1. 判斷用戶最主要的情緒 (emotion)、強度 1-10 (intensity) 與判斷理由 (reason)。
+2. 先以同理的語氣回應這份情緒。
+3. 提供 2-4 條具體、可執行的行動步驟 (strategy_steps)，並以溫和的鼓勵作結。
+`EmotionAnalyzer` 與 `StrategyAdvisor` 只保留給特殊情況：用戶明確要求完整的情緒分析報告，或需要篇幅較長、分階段的行動計畫時才使用。
 
 你的行為準則：
-1.  **優先使用工具**：根據用戶的意圖，優先選擇最合適的工具來回應。不要自己編造答案，除非沒有工具可用。
+1.  **優先使用工具**：占卜、星座、心情紀錄與知識查詢請使用對應的工具，不要自己編造答案；情緒分析與一般建議則直接回覆。
 2.  **善用歷史紀錄**：在回應前，先考慮使用 `MoodHistoryChecker` 來檢查使用者的心情歷史，讓你的回應更具個人化和同理心。
 3.  **自然地對話**：不要生硬地說「我將使用XX工具」。而是將工具的輸出自然地融入你的對話中。
 4.  **富有同理心**：永遠保持溫暖和理解的語氣。在給予建議或占卜結果之前，先表示你理解用戶的感受。
 5.  **處理閒聊**：如果用戶只是閒聊或問候，不需要使用工具，直接以你「HealMate」的身份自然回應即可。
-6.  **結合多個工具**：如果情況複雜，你可以依序使用多個工具。例如，先用 `MoodHistoryChecker` 了解歷史情緒，再用 `EmotionAnalyzer` 分析當前訊息，最後用 `StrategyAdvisor` 提供建議。
+6.  **結合多個工具**：如果情況複雜，你可以使用多個工具。例如，先用 `MoodHistoryChecker` 了解歷史情緒，再直接結合當前訊息給出分析與建議。
+7.  **同時呼叫工具**：若需要多項獨立資訊，請一次發出多個 tool calls，讓工具可以同時執行；只有後一個工具需要前一個工具的結果時才依序呼叫。
 """
 
-prompt = ChatPromptTemplate.from_messages(
-    [
-        ("system", AGENT_SYSTEM_PROMPT),
-        MessagesPlaceholder(variable_name="chat_history"),
-        ("human", "{input}"),
-        MessagesPlaceholder(variable_name="agent_scratchpad"),
+# 4. Define the Memory
+# We keep between K and 2K interactions in an append-only window, so the history
+# prefix stays stable (and prompt-cacheable) between window resets.
+# With REDIS_URL set, the history lives in Redis with a TTL: it is shared across
+# workers, survives restarts and expires for inactive users instead of growing
+# the process memory. Without it (local development) history stays in-process.
+_redis_client = None
+
+
+def _build_memory(user_id: str) -> ExpandingWindowMemory:
+    """Create the conversation memory for a user."""
+    global _redis_client
+    if not settings.redis_url:
+        return ExpandingWindowMemory(k=5, memory_key="chat_history", return_messages=True)
+
+    history = RedisChatMessageHistory(
+        session_id=user_id, url=settings.redis_url, ttl=settings.memory_ttl_seconds
+    )
+    # Share one connection pool across all users instead of one pool per history.
+    if _redis_client is None:
+        _redis_client = history.redis_client
+    history.redis_client = _redis_client
+    return ExpandingWindowMemory(
+        k=5, memory_key="chat_history", return_messages=True, chat_memory=history
+    )
+
+
+# 5. Cache the per-user memory
+# Memory objects are cheap to build but the in-process ones hold the history itself,
+# so they are kept in an LRU bounded by MAX_CACHED_MEMORIES. Entries expire after the
+# same TTL as the Redis history; evicting a user drops their in-process history
+# (Redis-backed history is unaffected).
+MAX_CACHED_MEMORIES = 10_000
+user_memories = LRUCache(maxsize=MAX_CACHED_MEMORIES, ttl=settings.memory_ttl_seconds)
+
+
+def get_user_memory(user_id: str) -> ExpandingWindowMemory:
+    """Return the cached conversation memory for a user, building it on first use."""
+    memory = user_memories.get(user_id)
+    if memory is None:
+        memory = _build_memory(user_id)
+    # Storing it again restarts the TTL, so (like the Redis key) it counts from the last use.
+    user_memories.set(user_id, memory)
+    return memory
+
+
+async def remember_turn(user_id: str, text_message: str, reply: str) -> None:
+    """Save a turn answered without running the agent (e.g. from a reply cache) to memory."""
+    await get_user_memory(user_id).asave_context({"input": text_message}, {"output": reply})
+
+
+# 6. Tool dispatch
+# Every tool takes a single string; the schemas expose it as a `query` argument.
+TOOL_HANDLERS: Dict[str, Callable[..., Awaitable[str]]] = {tool.name: tool.coroutine for tool in tools}
+# Tools that need to know who is asking
+USER_SCOPED_TOOLS = {mood_history_tool.name}
+
+
+
+def _compile_tool_schema(tool: Tool) -> Dict[str, Any]:
+    """Build the OpenAI function schema for a single-string tool."""
+    return {
+        "type": "function",
+        "function": {
+            "name": tool.name,
+            # The descriptions are indented triple-quoted strings; strip the
+            # indentation once so it is not sent (and billed) on every call.
+            "description": inspect.cleandoc(tool.description),
+            "parameters": {
+                "type": "object",
+                "properties": {"query": {"type": "string", "description": "工具的輸入"}},
+                "required": ["query"],
+            },
+        },
+    }
+
+
+# Compiled once at import and shared, read-only, by every model call.
+TOOL_SCHEMAS: Tuple[Dict[str, Any], ...] = tuple(_compile_tool_schema(tool) for tool in tools)
+# Request arguments that are the same for every step of every run
+AGENT_COMPLETION_ARGS: Dict[str, Any] = {
+    "model": AGENT_MODEL,
+    "tools": TOOL_SCHEMAS,
+    "parallel_tool_calls": True,
+    "temperature": AGENT_TEMPERATURE,
+}
+
+
+async def _call_tool(user_id: str, name: str, arguments: str) -> str:
+    """Run one tool call from the model and return its output as text."""
+    handler = TOOL_HANDLERS.get(name)
+    if handler is None:
+        return f"{name} is not a valid tool, try one of [{', '.join(TOOL_HANDLERS)}]."
+    try:
+        query = json.loads(arguments or "{}").get("query", "")
+    except (json.JSONDecodeError, AttributeError):
+        # Models occasionally send the bare string instead of a JSON object.
+        query = arguments
+    logger.debug("[Agent] User %s calls %s with: %s", user_id, name, query)
+    try:
+        if name in USER_SCOPED_TOOLS:
+            return await handler(query, user_id=user_id)
+        return await handler(query)
+    except Exception as e:
+        logger.error("[Agent] Tool %s failed for user %s: %s", name, user_id, e)
+        return f"Error in {name}: {e}"
+
+
+def _history_to_openai(messages: List[BaseMessage]) -> List[Dict[str, Any]]:
+    """Convert stored LangChain chat messages to OpenAI chat messages."""
+    roles = {"human": "user", "ai": "assistant", "system": "system"}
+    return [
+        {"role": roles[message.type], "content": message.content}
+        for message in messages
+        if message.type in roles
     ]
-)
 
-# 4. Define the Memory
-# We use a windowed buffer to keep the last K interactions in memory.
-# Global dictionary to store memory for each user
-user_memories: Dict[str, ConversationBufferWindowMemory] = {}
-
-# 5. Create the Agent
-# This binds the LLM, prompt, and tools together.
-# agent = create_openai_tools_agent(llm, tools, prompt) # This will be created dynamically per user
-
-# 6. Create the Agent Executor
-# This is the runtime for the agent. It adds the memory and handles the execution loop.
-# agent_executor = AgentExecutor( # This will be created dynamically per user
-#     agent=agent,
-#     tools=tools,
-#     memory=memory,
-#     verbose=True,  # Set to True for debugging to see the agent's thoughts
-#     handle_parsing_errors=True, # Gracefully handle cases where the LLM output is not perfect
-# )
 
-# --- Main Invocation Function ---
+async def _run_agent_loop(
+    user_id: str, messages: List[Dict[str, Any]]
+) -> AsyncIterator[str]:
+    """
+    Call the model, run its tool calls concurrently and repeat until it answers.
 
-async def invoke_agent(
-    user_id: str,
-    text_message: Optional[str] = None,
-    image_base64: Optional[str] = None,
-) -> Dict[str, Any]:
+    Every model call is streamed: text deltas are yielded as they arrive, and tool
+    call fragments are assembled until the stream ends.
     """
-    Invoke the main agent with a user message (text and/or image) and return the response.
-    This function now correctly handles memory and multimodal inputs as expected by LangChain.
+    for step in range(MAX_AGENT_STEPS):
+        content_parts: List[str] = []
+        tool_calls: Dict[int, Dict[str, str]] = {}
+        async for chunk in stream_chat_completion(
+            messages=messages,
+            tool_choice="auto" if step < MAX_AGENT_STEPS - 1 else "none",
+            **AGENT_COMPLETION_ARGS,
+        ):
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content_parts.append(delta.content)
+                yield delta.content
+            for call in delta.tool_calls or []:
+                entry = tool_calls.setdefault(call.index, {"id": "", "name": "", "arguments": ""})
+                if call.id:
+                    entry["id"] = call.id
+                if call.function and call.function.name:
+                    entry["name"] += call.function.name
+                if call.function and call.function.arguments:
+                    entry["arguments"] += call.function.arguments
+
+        if not tool_calls:
+            return
+
+        # 同一輪的多個 tool calls 以 asyncio.gather 同時執行，延遲由加總變為取最大值
+        calls = [tool_calls[index] for index in sorted(tool_calls)]
+        results = await asyncio.gather(
+            *(_call_tool(user_id, call["name"], call["arguments"]) for call in calls)
+        )
+        messages.append({
+            "role": "assistant",
+            "content": "".join(content_parts) or None,
+            "tool_calls": [
+                {
+                    "id": call["id"],
+                    "type": "function",
+                    "function": {"name": call["name"], "arguments": call["arguments"]},
+                }
+                for call in calls
+            ],
+        })
+        messages.extend(
+            {"role": "tool", "tool_call_id": call["id"], "content": str(result)}
+            for call, result in zip(calls, results)
+        )
 
-    Args:
-        user_id: The user's unique identifier.
-        text_message: The text part of the user's message.
-        image_base64: The base64-encoded image from the user.
 
-    Returns:
-        A dictionary containing the agent's reply.
+# --- Startup Warmup ---
+WARMUP_TIMEOUT_SECONDS = 15
+
+
+async def warmup() -> None:
     """
-    
-    # 1. Retrieve or create memory for the user
-    if user_id not in user_memories:
-        user_memories[user_id] = ConversationBufferWindowMemory(
-            k=5, memory_key="chat_history", return_messages=True
-        )
-    memory = user_memories[user_id]
+    Open connections to the backends before the first user message arrives.
+
+    The first request after boot otherwise pays the TCP/TLS handshake to DeepSeek on
+    top of its own latency. Qdrant and the embedder are only warmed with
+    WARMUP_TAROT_BACKENDS set: warming them imports qdrant_client and loads the
+    embedder, which are otherwise deferred to the first tarot query so that workers
+    boot fast. Failures are only logged: a backend that is down at startup must not
+    keep the app from booting.
+    """
+    checks = {"LLM": aclient.models.list()}
+    if settings.warmup_tarot_backends:
+        checks["Qdrant"] = get_qdrant_client().get_collections()
+        checks["embedder"] = asyncio.to_thread(_embed_queries, ["warmup"])
+    results = await asyncio.gather(
+        *(asyncio.wait_for(check, WARMUP_TIMEOUT_SECONDS) for check in checks.values()),
+        return_exceptions=True,
+    )
+    for name, result in zip(checks, results):
+        if isinstance(result, BaseException):
+            logging.warning("Warmup of %s failed: %r", name, result)
+        else:
+            logging.info("Warmup of %s done.", name)
 
-    # 2. Construct the input for the agent
-    # The input should be a dictionary, where the 'input' key holds the user's message.
-    # For multimodal input, the value is a list of content blocks (text, image).
+
+# --- Intent Pre-Router ---
+# 「獅子座今日運勢」、「幫我抽一張牌」這類意圖很明確，用正規表示式直接判斷並呼叫工具，
+# 省下一次讓 LLM 決定要用哪個工具的往返；回覆仍由 LLM 產生 (抽牌解讀、改寫星座 API 的運勢原文)。
+ZODIAC_RE = re.compile(r"(白羊|金牛|雙子|巨蟹|獅子|處女|天秤|天蠍|射手|摩羯|水瓶|雙魚)座")
+FORTUNE_RE = re.compile(r"運勢|運氣")
+# 「抽到」、「抽出」、「抽中」是在問已經抽到的牌 (例如「昨天抽到的死神牌是什麼意思」)，交給 agent 判斷
+RANDOM_TAROT_RE = re.compile(r"抽(?![到出中]).{0,4}牌")
+
+
+# Streams for the routed tools: the reply goes straight to the user as it is generated.
+ROUTED_TOOL_STREAMS: Dict[str, Callable[[str], AsyncIterator[str]]] = {
+    horoscope_tool.name: stream_horoscope_reading,
+    random_tarot_reading_tool.name: stream_random_tarot_reading,
+}
+
+
+def _route_intent(text_message: str) -> Optional[Tool]:
+    """Return the tool for an unambiguous text intent, or None to let the agent decide."""
+    if ZODIAC_RE.search(text_message) and FORTUNE_RE.search(text_message):
+        return horoscope_tool
+    if RANDOM_TAROT_RE.search(text_message):
+        return random_tarot_reading_tool
+    return None
+
+
+def is_routed_horoscope(text_message: str) -> bool:
+    """Whether the message is routed straight to the horoscope tool, whose reply does not depend on the conversation."""
+    return _route_intent(text_message) is horoscope_tool
+
+
+# --- Main Invocation Function ---
+
+def _build_input_content(
+    text_message: Optional[str] = None,
+    image_base64: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Build the multimodal content blocks (text, image) for the agent input."""
     input_content: List[Dict[str, Any]] = []
-    
+
     # Add text content if it exists.
     if text_message:
         input_content.append({"type": "text", "text": text_message})
@@ -155,38 +339,90 @@ async def invoke_agent(
             "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"},
         })
 
+    return input_content
+
+
+async def stream_agent(
+    user_id: str,
+    text_message: Optional[str] = None,
+    image_base64: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """
+    Invoke the main agent and yield the reply token deltas as they are generated.
+
+    Streaming lets callers forward the first tokens to the user long before the
+    full reply is finished, so perceived latency is the time to first token.
+
+    Args:
+        user_id: The user's unique identifier.
+        text_message: The text part of the user's message.
+        image_base64: The base64-encoded image from the user.
+
+    Yields:
+        Text deltas of the agent's reply.
+    """
+    # 1. Construct the input for the agent
+    # The input should be a dictionary, where the 'input' key holds the user's message.
+    # For multimodal input, the value is a list of content blocks (text, image).
+    input_content = _build_input_content(text_message, image_base64)
     if not input_content:
-        return {"reply": "請提供一些訊息讓我處理。"}
-
-    # 3. Create a user-specific version of the mood history tool
-    mood_history_tool_for_user = Tool(
-        name="MoodHistoryChecker",
-        description="""查詢特定使用者的最近心情紀錄。在你提供個人化建議或分析前，可以使用此工具來了解使用者的情緒脈絡。這個工具不需要任何輸入。""",
-        func=None,
-        coroutine=partial(_run_mood_history_tool, user_id=user_id)
-    )
+        yield "請提供一些訊息讓我處理。"
+        return
+    # Only the text is stored in the history; images are not resent on later turns.
+    memory_input = text_message or "（使用者傳送了一張圖片）"
+
+    # 2. Get the (cached) memory for this user
+    memory = get_user_memory(user_id)
+
+    # Deterministic intents (text only) skip the agent's planning turn. The turn is
+    # still saved to memory so the agent keeps the context on later messages.
+    routed_tool = _route_intent(text_message) if text_message and not image_base64 else None
+    if routed_tool is not None:
+        logger.info("Routing message from user %s directly to %s", user_id, routed_tool.name)
+        reply_parts: List[str] = []
+        async for delta in ROUTED_TOOL_STREAMS[routed_tool.name](text_message):
+            reply_parts.append(delta)
+            yield delta
+        reply = "".join(reply_parts).strip()
+        await memory.asave_context({"input": memory_input}, {"output": reply})
+        return
+
+    # 3. Stream the agent run
+    # The history is read from memory before the run, and the new input plus the
+    # final output are saved once the run ends.
+    history = (await memory.aload_memory_variables({}))[memory.memory_key]
+    messages = [
+        {"role": "system", "content": AGENT_SYSTEM_PROMPT},
+        *_history_to_openai(history),
+        {"role": "user", "content": input_content},
+    ]
+    reply_parts: List[str] = []
+    async for delta in _run_agent_loop(user_id, messages):
+        reply_parts.append(delta)
+        yield delta
+    reply = "".join(reply_parts)
+    await memory.asave_context({"input": memory_input}, {"output": reply})
 
-    # Combine base tools with the user-specific tool
-    tools = base_tools + [mood_history_tool_for_user]
-
-    # 4. Create the agent and executor for this specific invocation
-    # This ensures that each user gets their own memory-equipped agent instance.
-    agent = create_openai_tools_agent(llm, tools, prompt)
-    agent_executor = AgentExecutor(
-        agent=agent,
-        tools=tools,
-        memory=memory,
-        verbose=True,
-        handle_parsing_errors=True,
-    )
-    
-    # 5. Invoke the agent with the correctly structured multimodal input
-    # The AgentExecutor will handle memory automatically:
-    # - It reads the history from `memory`.
-    # - It adds the current `input` to the conversation.
-    # - It executes the agent.
-    # - It saves the new input and the AI's response back to `memory`.
-    response = await agent_executor.ainvoke({"input": input_content})
-    
-    return {"reply": response.get("output", "抱歉，我現在遇到一點問題，暫時無法回應。")}
 
+async def invoke_agent(
+    user_id: str,
+    text_message: Optional[str] = None,
+    image_base64: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Invoke the main agent with a user message (text and/or image) and return the response.
+    This collects the streamed deltas from `stream_agent` into a single reply.
+
+    Args:
+        user_id: The user's unique identifier.
+        text_message: The text part of the user's message.
+        image_base64: The base64-encoded image from the user.
+
+    Returns:
+        A dictionary containing the agent's reply.
+    """
+    chunks = [
+        delta async for delta in stream_agent(user_id, text_message, image_base64)
+    ]
+    reply = "".join(chunks).strip()
+    return {"reply": reply or "抱歉，我現在遇到一點問題，暫時無法回應。"}
@@ -0,0 +1,68 @@
+"""Conversation memory for the HealMate agent.
+
+A sliding window (like `ConversationBufferWindowMemory`) changes the oldest message
+on every turn, so the history part of the prompt never matches the provider's
+prefix cache. `ExpandingWindowMemory` instead appends turns until it holds 2k of
+them and then snaps back to the latest k, giving k cache-friendly turns between
+resets while always keeping at least the last k turns in context.
+"""
+
+import asyncio
+from typing import Any, Dict, List
+
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain_community.chat_message_histories import RedisChatMessageHistory
+from langchain_core.messages import get_buffer_string
+
+
+class ExpandingWindowMemory(BaseChatMemory):
+    """Append-only chat memory that grows from k to 2k turns, then keeps the latest k."""
+
+    k: int = 5
+    memory_key: str = "chat_history"
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the whole stored window; it only changes at append or reset."""
+        return self._format(self.chat_memory.messages)
+
+    async def aload_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the whole stored window without blocking the event loop."""
+        return self._format(await self.chat_memory.aget_messages())
+
+    def _format(self, messages: List[Any]) -> Dict[str, Any]:
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {self.memory_key: get_buffer_string(messages)}
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        """Append the new turn and snap back to the latest k turns when the window is full."""
+        super().save_context(inputs, outputs)
+        self._snap_window()
+
+    async def asave_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        """Append the new turn and snap back to the latest k turns when the window is full."""
+        await super().asave_context(inputs, outputs)
+        if isinstance(self.chat_memory, RedisChatMessageHistory):
+            # The sync redis client would block the event loop for its round-trips.
+            await asyncio.to_thread(self._snap_window)
+        else:
+            self._snap_window()
+
+    def _snap_window(self) -> None:
+        # Each turn is a human message plus an AI message.
+        keep = self.k * 2
+        history = self.chat_memory
+        if isinstance(history, RedisChatMessageHistory):
+            # Messages are LPUSHed, newest first: keeping the head of the list is a
+            # single LTRIM, atomic across workers (unlike clear + re-add).
+            if history.redis_client.llen(history.key) >= 2 * keep:
+                history.redis_client.ltrim(history.key, 0, keep - 1)
+            return
+        messages = history.messages
+        if len(messages) >= 2 * keep:
+            history.clear()
+            history.add_messages(messages[-keep:])
@@ -5,37 +5,371 @@ into a set of composable `Tool` objects that a central LangChain agent can use t
 Each tool is self-contained and has a clear description, enabling the LLM to decide which tool to use for a given query.
 """
 
-import os
+import re
+import time
+import uuid
+import asyncio
 import logging
-from typing import Dict, Any, Optional, List
-from pydantic import BaseModel, Field
+from functools import lru_cache, wraps
+from urllib.parse import quote
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable, Dict, Any, Optional, List, Tuple
+from pydantic import BaseModel, Field, ValidationError
 
 from langchain.tools import Tool
 import httpx
-from langchain_community.embeddings import OllamaEmbeddings
-from openai import AsyncOpenAI
-from dotenv import load_dotenv
-from qdrant_client import QdrantClient, models
+import orjson
+from openai import DEFAULT_TIMEOUT, AsyncOpenAI
+
+from core.cache import LRUCache, SingleFlight
+from core.ratelimit import AsyncRateLimiter
+from .config import settings
+
+if TYPE_CHECKING:
+    from qdrant_client import AsyncQdrantClient, models
+
+logger = logging.getLogger(__name__)
+
+# Initialize clients
+# One shared HTTP/2 connection pool for every outbound HTTP call made by the tools:
+# DeepSeek (through `aclient`) and the plain HTTP APIs (horoscope, Wikipedia).
+# Concurrent calls reuse pooled connections instead of paying a TLS handshake each.
+http_client = httpx.AsyncClient(
+    http2=True,
+    timeout=10.0,
+    # Keep idle sockets for 5 minutes so connections warmed at startup stay usable.
+    limits=httpx.Limits(max_keepalive_connections=64, max_connections=128, keepalive_expiry=300),
+)
+
+aclient = AsyncOpenAI(
+    api_key=settings.deepseek_api_key,
+    base_url="https://api.deepseek.com/v1",
+    http_client=http_client,
+    # Without this the SDK would adopt the shared client's 10 s timeout, which is far
+    # too short for a full completion.
+    timeout=DEFAULT_TIMEOUT,
+    # The SDK retries 429s and 5xx with exponential backoff, honouring Retry-After.
+    max_retries=4,
+)
+
+# Bound concurrent DeepSeek requests and smooth their rate, so a burst of users does
+# not trip the provider's rate limit and stall every request behind 429 backoffs.
+DEEPSEEK_MAX_CONCURRENCY = 32
+DEEPSEEK_REQUESTS_PER_MINUTE = 500
+_deepseek_sem = asyncio.Semaphore(DEEPSEEK_MAX_CONCURRENCY)
+_deepseek_limiter = AsyncRateLimiter(DEEPSEEK_REQUESTS_PER_MINUTE, time_period=60)
+
+
+async def chat_completion(**kwargs: Any) -> Any:
+    """Call `aclient.chat.completions.create` under the shared concurrency and rate limits."""
+    async with _deepseek_sem, _deepseek_limiter:
+        return await aclient.chat.completions.create(**kwargs)
+
+
+async def stream_chat_completion(**kwargs: Any) -> AsyncIterator[Any]:
+    """Stream a chat completion's chunks under the shared concurrency and rate limits.
 
-# Load environment variables and initialize clients
-load_dotenv()
-aclient = AsyncOpenAI(api_key=os.getenv("DEEPSEEK_API_KEY"), base_url="https://api.deepseek.com/v1")
+    `create(stream=True)` returns as soon as the response headers arrive, so the
+    concurrency slot is held here until the stream is fully read or closed; otherwise
+    DEEPSEEK_MAX_CONCURRENCY would not bound the generations in progress.
+    """
+    async with _deepseek_sem:
+        async with _deepseek_limiter:
+            stream = await aclient.chat.completions.create(stream=True, **kwargs)
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.close()
 
 # --- RAG Setup for Tarot ---
 
-# Initialize Qdrant client and OpenAI embeddings
-# Make API key optional for local Docker deployments
-qdrant_api_key = os.getenv("QDRANT_API_KEY")
-qdrant_client = QdrantClient(
-    url=os.getenv("QDRANT_URL"),
-    api_key=qdrant_api_key if qdrant_api_key else None,
-)
-# Use the same embedding model as the one used to create the collection
-embeddings = OllamaEmbeddings(model="nomic-embed-text")
+# The Qdrant client and the embedder are imported and built on first use: qdrant_client
+# alone is about half of this module's import time, and requests that never reach the
+# tarot tools (menus, horoscope, mood history) should not pay for it.
+@lru_cache(maxsize=1)
+def get_qdrant_client() -> "AsyncQdrantClient":
+    """Return the shared async Qdrant client, so all lookups reuse its keep-alive connections."""
+    from qdrant_client import AsyncQdrantClient
+
+    # Make API key optional for local Docker deployments.
+    return AsyncQdrantClient(url=settings.qdrant_url, api_key=settings.qdrant_api_key)
+
+# Use the same embedding model as the one used to create the collection.
+# TAROT_EMBEDDER=fastembed embeds in-process with an int8-quantized ONNX model instead
+# of a round-trip to Ollama; its collection must be built with
+# `scripts/data_pipeline.py --embedder fastembed` since the vectors differ.
+TAROT_EMBEDDER = settings.tarot_embedder
+FASTEMBED_MODEL = settings.fastembed_model
+
+if TAROT_EMBEDDER == "fastembed":
+    TAROT_COLLECTION_NAME = f"tarot_fastembed_{FASTEMBED_MODEL.replace(':', '_').replace('/', '_')}"
+else:
+    TAROT_COLLECTION_NAME = "tarot_cards_ollama_nomic-embed-text"
+
+
+@lru_cache(maxsize=1)
+def _get_embedder() -> Any:
+    """Load the configured embedder on first use (the fastembed model load is slow)."""
+    if TAROT_EMBEDDER == "fastembed":
+        from fastembed import TextEmbedding
+
+        return TextEmbedding(model_name=FASTEMBED_MODEL)
+    from langchain_community.embeddings import OllamaEmbeddings
+
+    # Queries are embedded in batches via `embed_documents`, so it must use the query
+    # instruction prefix to produce the same vectors as `embed_query`.
+    return OllamaEmbeddings(model="nomic-embed-text", embed_instruction="query: ")
+
+
+def _embed_queries(queries: List[str]) -> List[List[float]]:
+    """Embed a batch of queries with the configured embedder (blocking)."""
+    embedder = _get_embedder()
+    if TAROT_EMBEDDER == "fastembed":
+        return [vector.tolist() for vector in embedder.embed(queries)]
+    return embedder.embed_documents(queries)
+
+
+def _normalize_query(query: str) -> str:
+    """Normalize a query (case and whitespace) so near-identical prompts share cache entries."""
+    return " ".join(query.strip().lower().split())
+
+
+# Repeated prompts (e.g. "今日運勢", "抽一張牌") skip the embedding and Qdrant round-trips.
+# Entries are tuples so cached values cannot be mutated by callers.
+_embedding_cache = LRUCache(maxsize=4096)
+_search_cache = LRUCache(maxsize=2048)
+
+# Payload fields used to build the tarot prompt
+TAROT_PAYLOAD_FIELDS = ["name", "orientation", "meaning"]
+
+# Identical tarot, emotion and strategy tool calls that are in flight at the same time
+# (a double-tapped send, many users asking the same question) share one LLM/RAG run.
+_tool_flights = SingleFlight()
+
+
+def _coalesced(tool_name: str) -> Callable[[Callable[[str], Awaitable[str]]], Callable[[str], Awaitable[str]]]:
+    """Decorate a tool coroutine so concurrent calls with the same query run it once."""
+    def decorator(func: Callable[[str], Awaitable[str]]) -> Callable[[str], Awaitable[str]]:
+        @wraps(func)
+        async def wrapper(query: str) -> str:
+            return await _tool_flights.do((tool_name, _normalize_query(query)), lambda: func(query))
+        return wrapper
+    return decorator
+
+
+class _TarotRetrievalBatcher:
+    """Micro-batches concurrent tarot lookups into one embed call and one Qdrant batch search.
+
+    Queries arriving within `max_wait` seconds of each other are embedded together
+    with `embed_documents` and searched with a single `query_batch_points` request. The
+    blocking embedding call runs in a worker thread and Qdrant is queried with the
+    async client, so the event loop is never stalled.
+    """
+
+    def __init__(self, max_wait: float = 0.02, max_batch: int = 16, limit: int = 3):
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self.limit = limit
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # Embedding cache counters, for observability
+        self.embed_hits = 0
+        self.embed_misses = 0
+
+    async def retrieve(self, query: str) -> tuple:
+        """Return the payloads of the top matching cards for `query`.
+
+        Results are served from the search cache when possible; otherwise the query
+        is batched with concurrent callers.
+        """
+        query = _normalize_query(query)
+        cached = _search_cache.get(query)
+        if cached is not None:
+            return cached
+
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, future))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                results = await self._search([query for query, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (query, future), result in zip(batch, results):
+                payloads = tuple(point.payload for point in result)
+                _search_cache.set(query, payloads)
+                if not future.done():
+                    future.set_result(payloads)
+
+    async def embed(self, queries: List[str]) -> List[tuple]:
+        """Embed queries, only calling the embedder for cache misses."""
+        misses = list(dict.fromkeys(q for q in queries if q not in _embedding_cache))
+        if misses:
+            fresh = await asyncio.to_thread(_embed_queries, misses)
+            for query, vector in zip(misses, fresh):
+                _embedding_cache.set(query, tuple(vector))
+        self.embed_hits += len(queries) - len(misses)
+        self.embed_misses += len(misses)
+        logger.debug(
+            "[Tarot Tool] Embedding cache: %d hits, %d misses, %d cached",
+            self.embed_hits, self.embed_misses, len(_embedding_cache),
+        )
+        return [_embedding_cache.get(query) for query in queries]
+
+    async def _search(self, queries: List[str]) -> List[List["models.ScoredPoint"]]:
+        from qdrant_client import models
+
+        vectors = await self.embed(queries)
+        responses = await get_qdrant_client().query_batch_points(
+            collection_name=TAROT_COLLECTION_NAME,
+            requests=[
+                models.QueryRequest(
+                    query=list(vector),
+                    limit=self.limit,
+                    # Only fetch the fields the prompt uses, not the whole card payload
+                    with_payload=models.PayloadSelectorInclude(include=TAROT_PAYLOAD_FIELDS),
+                    params=models.SearchParams(
+                        hnsw_ef=64,
+                        exact=False,
+                        # Search the int8 quantized vectors, then rescore 2x candidates with
+                        # the original vectors (ignored for unquantized collections)
+                        quantization=models.QuantizationSearchParams(rescore=True, oversampling=2.0),
+                    ),
+                )
+                for vector in vectors
+            ],
+        )
+        return [response.points for response in responses]
+
+
+tarot_retriever = _TarotRetrievalBatcher()
+
+
+# --- Tarot Reply Caches ---
+
+# Exact repeats of a question (after normalization) reuse the reading for an hour.
+_reply_cache = LRUCache(maxsize=1024, ttl=3600)
+# Near-identical questions reuse a stored reading from a small Qdrant collection.
+# It holds vectors from the tarot embedder, so it is named after the tarot collection.
+TAROT_QUERY_CACHE_COLLECTION = f"{TAROT_COLLECTION_NAME}_query_cache"
+SEMANTIC_CACHE_THRESHOLD = 0.95
+# Stored readings expire after a day; expired points are deleted at most once per
+# SEMANTIC_CACHE_PURGE_INTERVAL, so the collection (and its search cost) stays bounded.
+SEMANTIC_CACHE_TTL_SECONDS = 24 * 3600
+SEMANTIC_CACHE_PURGE_INTERVAL = 3600
+# Namespace for the point ids: a query always maps to the same point, so repeats overwrite it
+_SEMANTIC_CACHE_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, TAROT_QUERY_CACHE_COLLECTION)
+_semantic_cache_ready = False
+_semantic_cache_purged_at = 0.0
+
+
+def _semantic_cache_point_id(normalized_query: str) -> str:
+    return str(uuid.uuid5(_SEMANTIC_CACHE_NAMESPACE, normalized_query))
+
+
+def _semantic_cache_fresh_filter(now: float) -> "models.Filter":
+    """Match the points stored less than SEMANTIC_CACHE_TTL_SECONDS ago."""
+    from qdrant_client import models
+
+    return models.Filter(must=[
+        models.FieldCondition(key="created_at", range=models.Range(gte=now - SEMANTIC_CACHE_TTL_SECONDS))
+    ])
+
+
+async def _semantic_cache_lookup(vector: tuple) -> Optional[str]:
+    """Return a fresh stored reading for a query at least SEMANTIC_CACHE_THRESHOLD similar, if any."""
+    global _semantic_cache_ready
+    from qdrant_client import models
+
+    qdrant_client = get_qdrant_client()
+    try:
+        if not _semantic_cache_ready:
+            if not await qdrant_client.collection_exists(TAROT_QUERY_CACHE_COLLECTION):
+                await qdrant_client.create_collection(
+                    collection_name=TAROT_QUERY_CACHE_COLLECTION,
+                    vectors_config=models.VectorParams(size=len(vector), distance=models.Distance.COSINE),
+                    # The cache only needs near-duplicates, so 1-bit vectors (rescored) suffice.
+                    quantization_config=models.BinaryQuantization(
+                        binary=models.BinaryQuantizationConfig(always_ram=True)
+                    ),
+                )
+                await qdrant_client.create_payload_index(
+                    collection_name=TAROT_QUERY_CACHE_COLLECTION,
+                    field_name="created_at",
+                    field_schema=models.PayloadSchemaType.FLOAT,
+                )
+            _semantic_cache_ready = True
+        response = await qdrant_client.query_points(
+            collection_name=TAROT_QUERY_CACHE_COLLECTION,
+            query=list(vector),
+            query_filter=_semantic_cache_fresh_filter(time.time()),
+            limit=1,
+            score_threshold=SEMANTIC_CACHE_THRESHOLD,
+            with_payload=["reply"],
+        )
+    except Exception as e:
+        logger.warning("[Tarot Tool] Semantic cache lookup failed: %s", e)
+        return None
+    return response.points[0].payload["reply"] if response.points else None
+
+
+async def _semantic_cache_store(normalized_query: str, vector: tuple, reply: str) -> None:
+    """Store a reading in the semantic cache collection and purge expired readings."""
+    global _semantic_cache_purged_at
+    from qdrant_client import models
+
+    qdrant_client = get_qdrant_client()
+    now = time.time()
+    try:
+        await qdrant_client.upsert(
+            collection_name=TAROT_QUERY_CACHE_COLLECTION,
+            points=[models.PointStruct(
+                id=_semantic_cache_point_id(normalized_query),
+                vector=list(vector),
+                payload={"reply": reply, "created_at": now},
+            )],
+        )
+        if now - _semantic_cache_purged_at >= SEMANTIC_CACHE_PURGE_INTERVAL:
+            _semantic_cache_purged_at = now
+            await qdrant_client.delete(
+                collection_name=TAROT_QUERY_CACHE_COLLECTION,
+                points_selector=models.FilterSelector(filter=models.Filter(must=[
+                    models.FieldCondition(
+                        key="created_at", range=models.Range(lt=now - SEMANTIC_CACHE_TTL_SECONDS)
+                    )
+                ])),
+            )
+    except Exception as e:
+        logger.warning("[Tarot Tool] Semantic cache store failed: %s", e)
 
 
 # --- Tarot Reading Tool (RAG Version) ---
 
+def _system_messages(system_prompt: str) -> tuple:
+    """Build a tool's system message once at import; each call only appends the user turn."""
+    return ({"role": "system", "content": system_prompt.strip()},)
+
+
 TAROT_SYSTEM_PROMPT = """你是一位專業的塔羅牌占卜師，你的任務是為用戶解讀抽到的塔羅牌。
 請根據用戶的問題、抽到的牌（包括正逆位），提供一段溫暖、有啟發性且具體的解讀。
 你的回應應該包含：
@@ -43,29 +377,58 @@ TAROT_SYSTEM_PROMPT = """你是一位專業的塔羅牌占卜師，你的任務
 2. 綜合所有牌的意義，針對用戶的問題給出一個整體的分析和建議。
 3. 使用溫和、鼓勵的語氣，給予用戶正向的引導。
 """
+_TAROT_MESSAGES = _system_messages(TAROT_SYSTEM_PROMPT)
+
+# Static instructions go first and the per-request query/cards last, so the
+# system prompt plus this preamble form a stable prefix for provider prompt caching.
+TAROT_USER_STATIC = """以下是使用者的提問與檢索到的牌卡，請依照系統指示進行解讀。
+請基於牌義，為用戶提供一次完整、有深度的塔羅牌解讀。
+---
+"""
+
+
+def _log_prompt_cache_usage(tool_name: str, response: Any) -> None:
+    """Log how many prompt tokens were served from the provider's prefix cache."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    # DeepSeek reports `prompt_cache_hit_tokens`; OpenAI reports `prompt_tokens_details.cached_tokens`.
+    cached = getattr(usage, "prompt_cache_hit_tokens", None)
+    if cached is None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None)
+    logger.info("[%s] prompt tokens: %s, cached: %s", tool_name, usage.prompt_tokens, cached)
 
+
+@_coalesced("TarotReader")
 async def _run_tarot_tool(query: str) -> str:
     """The core logic for the tarot reading tool, using RAG with Qdrant."""
     try:
-        print("[Tarot Tool] 步驟 1: 開始向量化查詢...")
-        query_vector = embeddings.embed_query(query)
-        print("[Tarot Tool] 步驟 2: 查詢已向量化，正在搜尋 Qdrant...")
-
-        search_results = qdrant_client.search(
-            collection_name="tarot_cards_ollama_nomic-embed-text",
-            query_vector=query_vector,
-            limit=3,  # Retrieve the top 3 most relevant cards
-            with_payload=True, # Include the card data in the result
-        )
-        print(f"[Tarot Tool] 步驟 3: Qdrant 搜尋完成，找到 {len(search_results)} 個結果。")
+        normalized_query = _normalize_query(query)
+        cached_reply = _reply_cache.get(normalized_query)
+        if cached_reply is not None:
+            logger.debug("[Tarot Tool] 命中回覆快取，直接回傳。")
+            return cached_reply
+
+        # The vector lands in the embedding cache, so the retrieval below reuses it.
+        query_vector = (await tarot_retriever.embed([normalized_query]))[0]
+        cached_reply = await _semantic_cache_lookup(query_vector)
+        if cached_reply is not None:
+            logger.debug("[Tarot Tool] 命中語意快取，直接回傳。")
+            _reply_cache.set(normalized_query, cached_reply)
+            return cached_reply
+
+        logger.debug("[Tarot Tool] 步驟 1-2: 向量化查詢並搜尋 Qdrant (批次處理)...")
+        # Retrieve the top 3 most relevant cards, including the card data
+        search_results = await tarot_retriever.retrieve(query)
+        logger.debug("[Tarot Tool] 步驟 3: Qdrant 搜尋完成，找到 %d 個結果。", len(search_results))
 
         if not search_results:
             return "抱歉，我沒有找到與您問題相關的塔羅牌。可以請您換個方式問嗎？"
 
-        print("[Tarot Tool] 步驟 4: 正在為 LLM 準備上下文...")
+        logger.debug("[Tarot Tool] 步驟 4: 正在為 LLM 準備上下文...")
         retrieved_cards_info = []
-        for result in search_results:
-            payload = result.payload
+        for payload in search_results:
             card_name = payload.get('name', '未知卡牌')
             orientation = '正位' if payload.get('orientation') == 'upright' else '逆位'
             meaning = payload.get('meaning', '無')
@@ -73,27 +436,26 @@ async def _run_tarot_tool(query: str) -> str:
         
         context_for_llm = "\n".join(retrieved_cards_info)
 
-        prompt_to_llm = f"""用戶問題：{query}
+        prompt_to_llm = TAROT_USER_STATIC + f"用戶問題：{query}\n\n抽到的牌：\n{context_for_llm}"
+        logger.debug("[Tarot Tool] 步驟 5: 上下文已準備好，正在呼叫 LLM...")
 
-根據您的問題，我為您抽到了以下幾張相關的牌：
-{context_for_llm}
-
-請基於以上牌義，為用戶提供一次完整、有深度的塔羅牌解讀。"""
-        print("[Tarot Tool] 步驟 5: 上下文已準備好，正在呼叫 LLM...")
-
-        response = await aclient.chat.completions.create(
+        response = await chat_completion(
             model="deepseek-chat",
             messages=[
-                {"role": "system", "content": TAROT_SYSTEM_PROMPT},
+                *_TAROT_MESSAGES,
                 {"role": "user", "content": prompt_to_llm},
             ],
             temperature=0.7,
             max_tokens=800,
         )
-        print("[Tarot Tool] 步驟 6: LLM 呼叫成功。")
-        return response.choices[0].message.content.strip()
+        _log_prompt_cache_usage("Tarot Tool", response)
+        logger.debug("[Tarot Tool] 步驟 6: LLM 呼叫成功。")
+        reply = response.choices[0].message.content.strip()
+        _reply_cache.set(normalized_query, reply)
+        await _semantic_cache_store(normalized_query, query_vector, reply)
+        return reply
     except Exception as e:
-        print(f"[Tarot Tool] 執行時發生錯誤: {e}")
+        logger.error("[Tarot Tool] 執行時發生錯誤: %s", e)
         return f"Error in Tarot Tool: {e}"
 
 tarot_reading_tool = Tool(
@@ -122,36 +484,52 @@ JSON 應包含以下三個欄位：
 3. `reason`: 字串，簡要說明你判斷該情緒的理由。
 
 請直接回傳 JSON 物件，不要包含任何額外的解釋或 markdown 格式。"""
+_EMOTION_MESSAGES = _system_messages(EMOTION_SYSTEM_PROMPT)
+
+# The analysis runs at temperature 0, so a repeated message within a session reuses it.
+_emotion_cache = LRUCache(maxsize=2048, ttl=600)
 
+@_coalesced("EmotionAnalyzer")
 async def _run_emotion_tool(query: str) -> str:
     """The core logic for the emotion analysis tool."""
+    cache_key = _normalize_query(query)
+    cached = _emotion_cache.get(cache_key)
+    if cached is not None:
+        return cached
     try:
-        response = await aclient.chat.completions.create(
+        response = await chat_completion(
             model="deepseek-chat", # 使用 DeepSeek 模型
             messages=[
-                {"role": "system", "content": EMOTION_SYSTEM_PROMPT},
+                *_EMOTION_MESSAGES,
                 {"role": "user", "content": query},
             ],
             temperature=0,
             max_tokens=150,
             response_format={"type": "json_object"},
         )
+        _log_prompt_cache_usage("Emotion Tool", response)
         json_output = response.choices[0].message.content.strip()
         try:
-            parsed_result = EmotionAnalysisResult.parse_raw(json_output)
-            return parsed_result.json() # 返回標準化的 JSON
-        except Exception as e:
-            logging.error(f"Failed to parse emotion analysis JSON: {e}. Raw output: {json_output}")
-            return json.dumps({"error": "無法解析情緒分析結果", "raw_output": json_output})
+            # JSON mode already returns well-formed JSON: validate it and pass it through
+            # as is, re-serializing only when fields had to be coerced (e.g. "7" -> 7).
+            EmotionAnalysisResult.model_validate_json(json_output, strict=True)
+            result = json_output
+        except ValidationError:
+            try:
+                result = EmotionAnalysisResult.model_validate_json(json_output).model_dump_json()
+            except ValidationError as e:
+                logger.error("Failed to parse emotion analysis JSON: %s. Raw output: %s", e, json_output)
+                return orjson.dumps({"error": "無法解析情緒分析結果", "raw_output": json_output}).decode()
+        _emotion_cache.set(cache_key, result)
+        return result
     except Exception as e:
         return f"Error in Emotion Tool: {e}"
 
 emotion_analysis_tool = Tool(
     name="EmotionAnalyzer",
-    description="""當需要深入了解用戶文字背後的情緒狀態時使用。
-    這個工具可以分析一段文字，並回傳其中包含的主要情緒、強度和原因。
+    description="""僅在用戶明確要求完整的情緒分析報告時使用；一般情況下請直接判斷用戶的情緒。
+    這個工具可以分析一段文字，並回傳其中包含的主要情緒、強度和原因 (JSON)。
     它不直接回答用戶問題，而是為主代理提供決策參考。
-    例如，在提供建議前，可以先用此工具分析用戶的情緒，以便給出更貼切的回應。
     輸入應該是需要被分析情緒的原始用戶訊息。""",
     func=_run_emotion_tool,
     coroutine=_run_emotion_tool,
@@ -171,28 +549,30 @@ STRATEGY_SYSTEM_PROMPT = """你是一位專業的策略顧問，擅長為用戶
 - 避免使用過於學術或技術性的詞彙。
 - 建議需要具體且可行，而非空洞的勵志語。
 - **重要提示：你提供的所有建議僅供參考，不能取代專業的醫療、法律、金融或心理諮詢。請避免提供任何可能對用戶造成傷害的建議。**"""
+_STRATEGY_MESSAGES = _system_messages(STRATEGY_SYSTEM_PROMPT)
 
+@_coalesced("StrategyAdvisor")
 async def _run_strategy_tool(query: str) -> str:
     """The core logic for the strategy tool."""
     try:
-        response = await aclient.chat.completions.create(
+        response = await chat_completion(
             model="deepseek-chat",
             messages=[
-                {"role": "system", "content": STRATEGY_SYSTEM_PROMPT},
+                *_STRATEGY_MESSAGES,
                 {"role": "user", "content": query},
             ],
             temperature=0.7,
             max_tokens=500,
         )
+        _log_prompt_cache_usage("Strategy Tool", response)
         return response.choices[0].message.content.strip()
     except Exception as e:
         return f"Error in Strategy Tool: {e}"
 
 strategy_tool = Tool(
     name="StrategyAdvisor",
-    description="""當用戶需要針對特定問題或困境尋求建議、方法或具體行動步驟時使用。
-    這個工具可以提供個人化、可行的策略。
-    適用於詢問「我該怎麼辦？」、「有什麼建議嗎？」、「如何解決這個問題？」等需要指導和策略的情況。
+    description="""僅在用戶需要篇幅較長、分階段的完整行動計畫時使用；一般的「我該怎麼辦？」請直接給出 2-4 條建議。
+    這個工具可以針對特定問題或困境提供個人化、可行的策略。
     輸入應該是完整描述用戶問題的句子。""",
     func=_run_strategy_tool,  # For sync compatibility if needed
     coroutine=_run_strategy_tool, # For async execution
@@ -212,56 +592,65 @@ RANDOM_TAROT_SYSTEM_PROMPT = """你是一位專業的塔羅牌占卜師，你的
 3. 結合用戶的問題，給出一個整體的分析和建議。
 4. 使用溫和、鼓勵的語氣，給予用戶正向的引導。
 """
+_RANDOM_TAROT_MESSAGES = _system_messages(RANDOM_TAROT_SYSTEM_PROMPT)
 
-async def _run_random_tarot_tool(query: str) -> str:
+RANDOM_TAROT_USER_STATIC = """以下是使用者的提問與隨機抽到的牌，請依照系統指示進行解讀。
+請基於牌卡資訊，為用戶提供一次完整、有深度的塔羅牌解讀。
+---
+"""
+
+# Every (card, orientation) outcome as a flat tuple of (name, orientation text, meaning),
+# so a draw is a single RNG call with no per-draw branching or dict lookups.
+_TAROT_DRAWS = tuple(
+    (card["name"], orientation_text, card[meaning_key])
+    for card in TAROT_CARDS
+    for orientation_text, meaning_key in (("正位", "meaning_up"), ("逆位", "meaning_rev"))
+)
+
+async def stream_random_tarot_reading(query: str) -> AsyncIterator[str]:
     """
-    Performs a random tarot card draw for the user and provides an interpretation.
+    Performs a random tarot card draw for the user and streams the interpretation.
     This tool simulates a real tarot reading by randomly selecting a card and its orientation.
+
+    When the reading goes straight to the user (see the agent's intent pre-router), the
+    first sentences can be sent while the rest is still being generated.
     """
     try:
-        print("[Random Tarot Tool] 步驟 1: 開始隨機抽牌...")
-        
-        # Randomly select one card from the list
-        card = random.choice(TAROT_CARDS)
-        
-        # Randomly determine the orientation (upright or reversed)
-        orientation = random.choice(['upright', 'reversed'])
-        
-        card_name = card['name']
+        logger.debug("[Random Tarot Tool] 步驟 1: 開始隨機抽牌...")
         
-        if orientation == 'upright':
-            orientation_text = "正位"
-            meaning = card['meaning_up']
-        else:
-            orientation_text = "逆位"
-            meaning = card['meaning_rev']
-
-        print(f"[Random Tarot Tool] 步驟 2: 抽牌完成。抽到的是 {card_name} ({orientation_text})。")
-
-        prompt_to_llm = f"""用戶問題：{query}
+        # Randomly select one card together with its orientation (upright or reversed)
+        card_name, orientation_text, meaning = random.choice(_TAROT_DRAWS)
 
-我為你抽到的牌是：**{card_name} ({orientation_text})**
+        logger.debug("[Random Tarot Tool] 步驟 2: 抽牌完成。抽到的是 %s (%s)。", card_name, orientation_text)
 
-牌義：{meaning}
-
-請基於以上資訊，為用戶提供一次完整、有深度的塔羅牌解讀。"""
+        prompt_to_llm = RANDOM_TAROT_USER_STATIC + f"用戶問題：{query}\n\n抽到的牌：{card_name} ({orientation_text})\n\n牌義：{meaning}"
         
-        print("[Random Tarot Tool] 步驟 3: 正在呼叫 LLM 進行解讀...")
-        response = await aclient.chat.completions.create(
+        logger.debug("[Random Tarot Tool] 步驟 3: 正在呼叫 LLM 進行解讀...")
+        async for chunk in stream_chat_completion(
             model="deepseek-chat",
             messages=[
-                {"role": "system", "content": RANDOM_TAROT_SYSTEM_PROMPT},
+                *_RANDOM_TAROT_MESSAGES,
                 {"role": "user", "content": prompt_to_llm},
             ],
             temperature=0.7,
             max_tokens=800,
-        )
-        print("[Random Tarot Tool] 步驟 4: LLM 解讀完成。")
-        return response.choices[0].message.content.strip()
+            stream_options={"include_usage": True},
+        ):
+            # The usage arrives in a final chunk without choices.
+            if chunk.usage is not None:
+                _log_prompt_cache_usage("Random Tarot Tool", chunk)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+        logger.debug("[Random Tarot Tool] 步驟 4: LLM 解讀完成。")
 
     except Exception as e:
-        print(f"[Random Tarot Tool] 執行時發生錯誤: {e}")
-        return f"Error in Random Tarot Tool: {e}"
+        logger.error("[Random Tarot Tool] 執行時發生錯誤: %s", e)
+        yield f"Error in Random Tarot Tool: {e}"
+
+
+async def _run_random_tarot_tool(query: str) -> str:
+    """Collect the streamed random tarot reading into one reply (used as an agent tool)."""
+    return "".join([delta async for delta in stream_random_tarot_reading(query)]).strip()
 
 random_tarot_reading_tool = Tool(
     name="RandomTarotReader",
@@ -276,40 +665,47 @@ random_tarot_reading_tool = Tool(
 # --- Horoscope Tool ---
 
 from core.database import SessionLocal
-from core.crud import get_mood_entries_by_user
+from core.crud import get_mood_entries_by_user, get_mood_summary_by_user
 
 
 # --- Mood History Tool ---
 
-async def _run_mood_history_tool(user_id: str, query: str = "") -> str:
-    """Fetches the user's recent mood history from the database and provides a summary."""
-    if not user_id:
-        return "無法查詢心情歷史，因為缺少 user_id。"
-    
-    db = SessionLocal()
-    try:
-        logging.info(f"[Mood History Tool] Fetching mood history summary for user {user_id}...")
-        
+def _fetch_mood_history(user_id: str) -> str:
+    """Build the mood history summary for a user from the database (blocking)."""
+    with SessionLocal() as db:
         # Get a summary of recent moods
         mood_summary = get_mood_summary_by_user(db, user_id=user_id, days=7)
         
         # Get detailed recent entries (optional, for more context if needed by LLM)
         mood_entries = get_mood_entries_by_user(db, user_id=user_id, limit=3) # Get top 3 for detail
-        detailed_entries = ""
-        if mood_entries:
-            detailed_entries = "\n最近的詳細紀錄：\n" + "\n".join(
-                [f"- {entry.timestamp.strftime('%Y-%m-%d %H:%M')}: {entry.mood} (強度: {entry.intensity if entry.intensity else 'N/A'}, 筆記: {entry.note if entry.note else '無'}, 標籤: {entry.tags if entry.tags else '無'})" for entry in mood_entries]
-            )
 
-        response = f"{mood_summary}{detailed_entries}"
-        logging.info(f"[Mood History Tool] Found history for user {user_id}:\n{response}")
+    if not mood_entries:
+        return mood_summary
+    detailed_entries = "\n".join(
+        f"- {entry.timestamp.strftime('%Y-%m-%d %H:%M')}: {entry.mood} (強度: {entry.intensity or 'N/A'}, 筆記: {entry.note or '無'}, 標籤: {entry.tags or '無'})"
+        for entry in mood_entries
+    )
+    return f"{mood_summary}\n最近的詳細紀錄：\n{detailed_entries}"
+
+
+async def _run_mood_history_tool(query: str = "", user_id: Optional[str] = None) -> str:
+    """Fetches the user's recent mood history from the database and provides a summary.
+
+    The tool is shared by all users: the agent loop passes the current user_id.
+    The SQLAlchemy session is synchronous, so the queries run in a worker thread.
+    """
+    if not user_id:
+        return "無法查詢心情歷史，因為缺少 user_id。"
+    
+    try:
+        logger.debug("[Mood History Tool] Fetching mood history summary for user %s...", user_id)
+        response = await asyncio.to_thread(_fetch_mood_history, user_id)
+        logger.debug("[Mood History Tool] Found history for user %s:\n%s", user_id, response)
         return response
         
     except Exception as e:
-        logging.error(f"[Mood History Tool] Error fetching mood history for user {user_id}: {e}")
+        logger.error("[Mood History Tool] Error fetching mood history for user %s: %s", user_id, e)
         return "查詢使用者心情歷史時發生錯誤。"
-    finally:
-        db.close()
 
 mood_history_tool = Tool(
     name="MoodHistoryChecker",
@@ -321,17 +717,30 @@ mood_history_tool = Tool(
 
 # --- Knowledge Base Tool (Wikipedia) ---
 
+# Common terms (「塔羅牌」、「認知行為療法」...) are looked up over and over; keep the
+# summaries for an hour.
+_wiki_cache = LRUCache(maxsize=512, ttl=3600)
+
+
 async def _run_knowledge_base_tool(query: str) -> str:
     """查詢維基百科摘要，回傳簡短解釋。"""
+    term = query.strip()
+    cache_key = _normalize_query(term)
+    cached = _wiki_cache.get(cache_key)
+    if cached is not None:
+        return cached
     try:
-        url = f"https://zh.wikipedia.org/api/rest_v1/page/summary/{query.strip()}"
-        async with httpx.AsyncClient(timeout=5) as client:
-            resp = await client.get(url)
-            if resp.status_code == 200:
-                data = resp.json()
-                return data.get("extract", "查無相關知識。")
-            else:
-                return "查無相關知識。"
+        url = f"https://zh.wikipedia.org/api/rest_v1/page/summary/{quote(term, safe='')}"
+        resp = await http_client.get(url, timeout=5)
+        if resp.status_code == 200:
+            data = resp.json()
+            summary = data.get("extract", "查無相關知識。")
+        elif resp.status_code == 404:
+            summary = "查無相關知識。"
+        else:
+            return "查無相關知識。"
+        _wiki_cache.set(cache_key, summary)
+        return summary
     except Exception as e:
         return f"查詢知識時發生錯誤: {e}"
 
@@ -343,59 +752,122 @@ knowledge_base_tool = Tool(
 )
 
 
-import httpx
-import re
-
 HOROSCOPE_SIGNS = {
     "白羊座": "Aries", "金牛座": "Taurus", "雙子座": "Gemini",
     "巨蟹座": "Cancer", "獅子座": "Leo", "處女座": "Virgo",
     "天秤座": "Libra", "天蠍座": "Scorpio", "射手座": "Sagittarius",
-    "摩羯座": "Capricorn", "水瓶座": "Aquarius", "雙魚座": "Pisces",
-    "aries": "Aries", "taurus": "Taurus", "gemini": "Gemini",
-    "cancer": "Cancer", "leo": "Leo", "virgo": "Virgo",
-    "libra": "Libra", "scorpio": "Scorpio", "sagittarius": "Sagittarius",
-    "capricorn": "Capricorn", "aquarius": "Aquarius", "pisces": "Pisces"
+    "摩羯座": "Capricorn", "水瓶座": "Aquarius", "雙魚座": "Pisces"
+}
+# Any sign name, Chinese or lower-cased English, -> (Chinese name, English name)
+_SIGN_LOOKUP = {
+    name: (sign_ch, sign_en)
+    for sign_ch, sign_en in HOROSCOPE_SIGNS.items()
+    for name in (sign_ch, sign_en.lower())
 }
 
-async def _run_horoscope_tool(query: str) -> str:
-    """Fetches the daily horoscope for a given zodiac sign."""
-    print(f"[Horoscope Tool] 接收到查詢: {query}")
+# All sign names (Chinese and English) in one precompiled alternation, longest first,
+# so a query is scanned once instead of once per sign.
+_SIGN_PATTERN = re.compile(
+    "|".join(re.escape(sign) for sign in sorted(_SIGN_LOOKUP, key=len, reverse=True)),
+    re.IGNORECASE,
+)
+
+# The API answers with this when it has no prediction for the day
+HOROSCOPE_NO_PREDICTION = "暫無預測"
+
+
+async def _fetch_horoscope(query: str) -> Tuple[Optional[str], str]:
+    """Fetch today's horoscope for the zodiac sign mentioned in `query`.
+
+    Returns (Chinese sign name, prediction), or (None, a message for the user) when
+    no sign is mentioned or the API call fails.
+    """
+    logger.debug("[Horoscope Tool] 接收到查詢: %s", query)
     sign_name_ch = None
     sign_name_en = None
 
-    # Find which zodiac sign is mentioned in the query
-    for sign_ch, sign_en in HOROSCOPE_SIGNS.items():
-        if re.search(sign_ch, query, re.IGNORECASE):
-            sign_name_ch = list(HOROSCOPE_SIGNS.keys())[list(HOROSCOPE_SIGNS.values()).index(sign_en)]
-            sign_name_en = sign_en
-            break
+    # Find which zodiac sign is mentioned in the query (single pass over the query)
+    match = _SIGN_PATTERN.search(query)
+    if match:
+        sign_name_ch, sign_name_en = _SIGN_LOOKUP[match.group(0).lower()]
 
     if not sign_name_en:
-        return "抱歉，請告訴我您想查詢哪個星座的運勢？例如：『獅子座今天運勢如何？』"
+        return None, "抱歉，請告訴我您想查詢哪個星座的運勢？例如：『獅子座今天運勢如何？』"
 
-    print(f"[Horoscope Tool] 辨識到星座: {sign_name_ch} ({sign_name_en})")
+    logger.debug("[Horoscope Tool] 辨識到星座: %s (%s)", sign_name_ch, sign_name_en)
     api_url = f"https://horoscope-app-api.vercel.app/api/v1/get-horoscope/daily?sign={sign_name_en}&day=TODAY"
 
     try:
-        async with httpx.AsyncClient() as client:
-            print(f"[Horoscope Tool] 正在呼叫 API: {api_url}")
-            response = await client.get(api_url, timeout=10.0)
-            response.raise_for_status() # Raise an exception for bad status codes (4xx or 5xx)
-            data = response.json()
-            print("[Horoscope Tool] API 呼叫成功，正在整理資料...")
-
-            horoscope_data = data.get('data', {})
-            prediction = horoscope_data.get('prediction', '暫無預測')
+        logger.debug("[Horoscope Tool] 正在呼叫 API: %s", api_url)
+        response = await http_client.get(api_url, timeout=10.0)
+        response.raise_for_status() # Raise an exception for bad status codes (4xx or 5xx)
+        data = response.json()
+        logger.debug("[Horoscope Tool] API 呼叫成功，正在整理資料...")
 
-            formatted_response = f"以下是 {sign_name_ch} 今天的運勢分析：\n\n{prediction}"
-            return formatted_response
+        horoscope_data = data.get('data', {})
+        return sign_name_ch, horoscope_data.get('prediction', HOROSCOPE_NO_PREDICTION)
 
     except httpx.RequestError as e:
-        print(f"[Horoscope Tool] API 請求錯誤: {e}")
-        return f"抱歉，查詢星座運勢時網路發生問題，請稍後再試。"
+        logger.warning("[Horoscope Tool] API 請求錯誤: %s", e)
+        return None, "抱歉，查詢星座運勢時網路發生問題，請稍後再試。"
+    except Exception as e:
+        logger.error("[Horoscope Tool] 發生未知錯誤: %s", e)
+        return None, "抱歉，處理您的星座運勢請求時發生了未知的錯誤。"
+
+
+def _format_horoscope(sign_name_ch: str, prediction: str) -> str:
+    return f"以下是 {sign_name_ch} 今天的運勢分析：\n\n{prediction}"
+
+
+async def _run_horoscope_tool(query: str) -> str:
+    """Fetches the daily horoscope for a given zodiac sign."""
+    sign_name_ch, prediction = await _fetch_horoscope(query)
+    if sign_name_ch is None:
+        return prediction
+    return _format_horoscope(sign_name_ch, prediction)
+
+
+HOROSCOPE_SYSTEM_PROMPT = """你是一位溫暖的星座運勢解說員。
+你會收到使用者的提問、他的星座，以及今天的運勢預測原文 (可能是英文)。
+請用繁體中文把運勢改寫成一段親切、簡短的解讀，並針對使用者的提問給一句具體的小建議。
+不要編造原文沒有的預測，也不要使用 Markdown 格式。
+"""
+_HOROSCOPE_MESSAGES = _system_messages(HOROSCOPE_SYSTEM_PROMPT)
+
+
+async def stream_horoscope_reading(query: str) -> AsyncIterator[str]:
+    """
+    Fetch today's horoscope and stream the model's rewrite of it for the user.
+
+    Used when the agent's intent pre-router sends the reply straight to the user: the
+    raw API prediction is not shown as is, and the first sentences can be sent while
+    the rest is still being generated.
+    """
+    sign_name_ch, prediction = await _fetch_horoscope(query)
+    if sign_name_ch is None or prediction == HOROSCOPE_NO_PREDICTION:
+        yield prediction if sign_name_ch is None else _format_horoscope(sign_name_ch, prediction)
+        return
+
+    prompt_to_llm = f"用戶問題：{query}\n\n星座：{sign_name_ch}\n\n今日運勢原文：{prediction}"
+    streamed = False
+    try:
+        async for chunk in stream_chat_completion(
+            model="deepseek-chat",
+            messages=[
+                *_HOROSCOPE_MESSAGES,
+                {"role": "user", "content": prompt_to_llm},
+            ],
+            temperature=0.7,
+            max_tokens=500,
+        ):
+            if chunk.choices and chunk.choices[0].delta.content:
+                streamed = True
+                yield chunk.choices[0].delta.content
     except Exception as e:
-        print(f"[Horoscope Tool] 發生未知錯誤: {e}")
-        return f"抱歉，處理您的星座運勢請求時發生了未知的錯誤。"
+        logger.error("[Horoscope Tool] 改寫運勢時發生錯誤: %s", e)
+        # Fall back to the raw prediction unless part of the rewrite was already sent.
+        if not streamed:
+            yield _format_horoscope(sign_name_ch, prediction)
 
 horoscope_tool = Tool(
     name="HoroscopeProvider",
@@ -407,3 +879,11 @@ horoscope_tool = Tool(
 )
 
 
+async def close_clients() -> None:
+    """Close the shared network clients (called on application shutdown)."""
+    # Closing `aclient` also closes `http_client`, which it uses as its transport.
+    closing = [aclient.close()]
+    # Only close the Qdrant client if it was ever created.
+    if get_qdrant_client.cache_info().currsize:
+        closing.append(get_qdrant_client().close())
+    await asyncio.gather(*closing, return_exceptions=True)
@@ -3,8 +3,11 @@
 # ====================================================
 import os
 import json
+import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import FastAPI, Request, HTTPException, BackgroundTasks, Depends
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 from pydantic import BaseModel
 # Import LINE Bot SDK v3 components with correct paths
 from linebot.v3.webhook import WebhookParser
@@ -16,9 +19,8 @@ from linebot.v3.webhooks.models.image_message_content import ImageMessageContent
 from linebot.v3.exceptions import InvalidSignatureError
 from linebot.v3.messaging import (
     Configuration,          # LINE API 設定
-    ApiClient,              # LINE API 客戶端
-    MessagingApi,           # LINE 訊息 API
-    MessagingApiBlob,       # LINE 訊息 API (Blob)
+    AsyncApiClient,         # LINE API 非同步客戶端
+    AsyncMessagingApi,      # LINE 訊息 API (非同步)
     ReplyMessageRequest,    # 回覆訊息請求
     TextMessage,            # 文字訊息類型
     ImageMessage,           # 圖片訊息類型
@@ -32,29 +34,29 @@ from linebot.v3.messaging import (
     CarouselColumn,         # 輪播欄位
 )
 import time                # 時間處理
-from pydub import AudioSegment  # 語音處理
 import io                  # IO 處理
 import uuid                # 用於生成唯一ID
 from dotenv import load_dotenv  # 用於載入 .env 檔案中的環境變數
 from typing import Dict, Any, List, Optional  # 用於類型提示
-import aiofiles            # 異步文件處理
 import re                  # 正則表達式處理
 
 # Import our new LangChain agent
-from agents.langchain_agent import invoke_agent
+from agents.langchain_agent import is_routed_horoscope, remember_turn, stream_agent, warmup
+from agents.tools import close_clients
 
 # Import our new LINE UI module
 from ui.line_ui import (
-    create_zodiac_quick_reply,
-    check_for_menu_keywords,
     check_for_zodiac_sign,
-    create_tarot_buttons,
-    create_main_menu_flex,
-    create_horoscope_menu_flex,
+    match_keyword_tags,
+    menu_type_from_tags,
     create_zodiac_carousel,
-    create_daily_fortune_flex,
-    create_mood_diary_flex,
+    MENU_MESSAGES,
+    TAROT_BUTTONS_MESSAGE,
+    HOROSCOPE_MENU_MESSAGE,
+    ZODIAC_QUICK_REPLY,
 )
+from ui.line_stream import LineStreamReplier
+from core.cache import LRUCache, SingleFlight
 
 def _get_tarot_service():
     from services.tarot import TarotService
@@ -79,28 +81,75 @@ app = FastAPI(
     # 增加性能優化設定
     docs_url=None,  # 關閉 Swagger 文檔於生產環境 (減少啟動時間)
     redoc_url=None,  # 關閉 ReDoc 文檔於生產環境
-    openapi_url=None  # 關閉 OpenAPI schema 生成
+    openapi_url=None,  # 關閉 OpenAPI schema 生成
+    default_response_class=ORJSONResponse,  # 以 orjson 序列化 JSON 回應 (比標準 json 快數倍)
 )
 
-# 快取機制 - 為常用操作提供快取
-cache = {}
+# 同一位使用者在短時間內重問同一個星座運勢時，直接重用剛才的回覆，省去 LLM 與星座 API 的往返。
+# 只快取結果不受對話脈絡影響的意圖：抽牌是隨機的，「然後呢」這類追問則取決於先前的對話
+AGENT_REPLY_CACHE_TTL_SECONDS = 60
+agent_reply_cache = LRUCache(maxsize=1024, ttl=AGENT_REPLY_CACHE_TTL_SECONDS)
+# 同時送達的重複訊息 (例如連點造成的兩個 webhook) 共用同一次 agent 執行
+agent_reply_flights = SingleFlight()
+# agent 沒有產生任何文字時的預設回覆
+AGENT_FALLBACK_REPLY = "抱歉，我現在有點問題，晚點再試一次。"
 
 from core.database import engine, Base
+from sqlalchemy import text
+
+# 預設執行緒池的大小 (見 startup_event)
+DEFAULT_EXECUTOR_WORKERS = 32
+# 啟動時是否同步資料表結構 (create_all + 補建索引)。每個 worker 開機都會對每個模型各做一次往返，
+# 資料表建立後可設為 false，只讓部署流程中的單一程序執行，縮短擴充時的開機時間
+RUN_SCHEMA_SYNC = os.getenv("RUN_SCHEMA_SYNC", "true").lower() in ("1", "true", "yes")
+
+
+def sync_schema() -> None:
+    """建立尚不存在的資料表與索引 (已存在則略過)"""
+    # Create all tables in the database that are defined in Base
+    Base.metadata.create_all(bind=engine)
+    # create_all 不會替既有的資料表補建新增的索引，這裡逐一補建 (已存在則略過)
+    for index in MoodEntry.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+
+def warm_db_pool() -> None:
+    """以 SELECT 1 預先建立一條資料庫連線，讓第一個心情查詢不必承擔連線與認證的延遲"""
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
 
 # 使用 lifespan 上下文管理器來延遲初始化資源
 @app.on_event("startup")
 async def startup_event():
-    logging.info("Starting up FastAPI server and creating database tables...")
-    # Create all tables in the database that are defined in Base
-    Base.metadata.create_all(bind=engine)
-    logging.info("Database tables created.")
+    logging.info("Starting up FastAPI server...")
+    if RUN_SCHEMA_SYNC:
+        sync_schema()
+        logging.info("Database tables created.")
+    # asyncio.to_thread (心情查詢、嵌入) 預設的執行緒數為 min(32, CPU 數 + 4)，
+    # 小型容器上只有個位數；放大到與資料庫連線池相當，避免突發流量時彼此排隊
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=DEFAULT_EXECUTOR_WORKERS)
+    )
+    # LINE 非同步客戶端內部的 aiohttp session 必須在事件迴圈中建立
+    global api_client, line_bot_api
+    api_client = AsyncApiClient(configuration)
+    line_bot_api = AsyncMessagingApi(api_client)
+    try:
+        await asyncio.to_thread(warm_db_pool)
+    except Exception as e:
+        # 資料庫暫時無法連線時只記錄警告，不阻止服務啟動 (pool_pre_ping 會在之後重新連線)
+        logging.warning("Warmup of database failed: %r", e)
+    # 預先建立與 LLM 的連線 (WARMUP_TAROT_BACKENDS 開啟時也包含 Qdrant / 嵌入模型)，避免第一位使用者承擔冷啟動延遲
+    await warmup()
     
 @app.on_event("shutdown")
 async def shutdown_event():
     logging.info("Shutting down FastAPI server")
-    # 釋放資源
+    # 釋放資源：關閉共用的 HTTP / LLM / Qdrant / LINE 連線
+    await close_clients()
+    if api_client is not None:
+        await api_client.close()
 
-from agents.tools import HOROSCOPE_SIGNS
 # 讀取必要環境變數
 LINE_CHANNEL_ACCESS_TOKEN = os.getenv("LINE_CHANNEL_ACCESS_TOKEN")
 LINE_CHANNEL_SECRET = os.getenv("LINE_CHANNEL_SECRET")
@@ -111,10 +160,12 @@ if not (LINE_CHANNEL_ACCESS_TOKEN and LINE_CHANNEL_SECRET):
 
 # 初始化 LINE SDK
 configuration = Configuration(access_token=LINE_CHANNEL_ACCESS_TOKEN)
-api_client = ApiClient(configuration)
-line_bot_api = MessagingApi(api_client)
+# 非同步客戶端於 startup_event 中建立，所有請求共用同一個連線池
+api_client: Optional[AsyncApiClient] = None
+line_bot_api: Optional[AsyncMessagingApi] = None
 # handler = WebhookHandler(LINE_CHANNEL_SECRET) # WebhookHandler instance no longer used for dispatching
-# WebhookParser will be instantiated in the callback
+# WebhookParser 只在啟動時建立一次，所有 webhook 請求共用
+parser = WebhookParser(LINE_CHANNEL_SECRET)
 
 
 # 儲存使用者的系統提示詞設定
@@ -194,12 +245,18 @@ class MoodRequest(BaseModel):
     tags: Optional[List[str]] = None
 
 @app.post("/mood")
-async def record_mood(req: MoodRequest, db: Session = Depends(get_db)):
+def record_mood(req: MoodRequest, db: Session = Depends(get_db)):
     """
     Records a user's mood entry from the LIFF app.
+
+    The SQLAlchemy session is synchronous, so this is a plain `def` endpoint:
+    FastAPI runs it in its thread pool instead of blocking the event loop.
     """
     try:
-        logging.info(f"Recording mood for user {req.user_id}: {req.mood} (Intensity: {req.intensity}, Note: {req.note}, Tags: {req.tags})")
+        logging.info(
+            "Recording mood for user %s: %s (Intensity: %s, Note: %s, Tags: %s)",
+            req.user_id, req.mood, req.intensity, req.note, req.tags,
+        )
         mood_entry = MoodEntry(
             user_id=req.user_id,
             mood=req.mood,
@@ -212,7 +269,7 @@ async def record_mood(req: MoodRequest, db: Session = Depends(get_db)):
         db.refresh(mood_entry)
         return {"status": "success", "entry_id": mood_entry.id}
     except Exception as e:
-        logging.error(f"Failed to record mood: {e}")
+        logging.error("Failed to record mood: %s", e)
         db.rollback()
         raise HTTPException(status_code=500, detail="Failed to record mood entry.")
 
@@ -236,14 +293,15 @@ async def rag_query(req: RAGQueryRequest):
             limit=req.limit,
             filter_params=req.filters
         )
-        return {"results": results, "count": len(results)}
+        # 結果只含 Qdrant payload 的基本型別，直接交給 orjson 序列化，略過 FastAPI 逐層走訪的 jsonable_encoder
+        return ORJSONResponse({"results": results, "count": len(results)})
     except ConnectionError:
         raise HTTPException(
             status_code=503,
             detail="Vector database connection failed. Check if Qdrant is running."
         )
     except Exception as e:
-        logging.error(f"RAG query failed: {e}")
+        logging.error("RAG query failed: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -275,38 +333,42 @@ async def callback(request: Request, background_tasks: BackgroundTasks):
     signature = request.headers.get("X-Line-Signature", "")
     body = await request.body()
     try:
-        logging.info(f"Callback received. Signature: {signature}")
+        logging.info("Callback received. Signature: %s", signature)
+        # WebhookParser.parse 只接受文字 (簽章驗證時會再 encode)，因此只解碼一次並重複使用
+        body_text = body.decode("utf-8")
         # Log only a small part of the body to avoid excessive logging and potential sensitive data exposure
-        logging.debug(f"Request body (first 100 chars): {body.decode()[:100]}")
+        logging.debug("Request body (first 100 chars): %s", body_text[:100])
 
-        parser = WebhookParser(LINE_CHANNEL_SECRET)
-        events = parser.parse(body.decode(), signature)
+        events = parser.parse(body_text, signature)
+        # 同一個 webhook 內的文字訊息集中在一個背景工作中同時處理
+        text_events = []
         for event in events:
-            logging.info(f"Processing event: {type(event)}")
+            logging.info("Processing event: %s", type(event))
             if isinstance(event, MessageEvent):
-                # Create API client for message handlers
-                with ApiClient(configuration) as api_client:
-                    line_bot_api = MessagingApi(api_client)
-                    if isinstance(event.message, TextMessageContent):
-                        background_tasks.add_task(handle_text_message, event, line_bot_api)
-                    elif isinstance(event.message, ImageMessageContent):
-                        background_tasks.add_task(handle_image_message, event, line_bot_api)
-                    elif isinstance(event.message, AudioMessageContent):
-                        background_tasks.add_task(handle_audio_message, event, line_bot_api)
+                # 使用模組層級的 line_bot_api：背景工作在此請求結束後才執行，
+                # 不能使用在這裡以 with 建立、離開區塊就關閉的客戶端
+                if isinstance(event.message, TextMessageContent):
+                    text_events.append(event)
+                elif isinstance(event.message, ImageMessageContent):
+                    background_tasks.add_task(handle_image_message, event, line_bot_api)
+                elif isinstance(event.message, AudioMessageContent):
+                    background_tasks.add_task(handle_audio_message, event, line_bot_api)
             # Add more event types here if needed (e.g., FollowEvent, UnfollowEvent)
             # else:
-            #     logging.info(f"Unhandled event type: {type(event)}")
+            #     logging.info("Unhandled event type: %s", type(event))
+        if text_events:
+            background_tasks.add_task(handle_text_events, text_events, line_bot_api)
     except InvalidSignatureError:
         logging.error("Invalid signature. Please check your LINE_CHANNEL_SECRET.")
         # You can uncomment the line below to log the received signature for debugging,
         # but be cautious as signatures might be considered sensitive.
-        # logging.error(f"Received signature for comparison: {signature}")
+        # logging.error("Received signature for comparison: %s", signature)
         raise HTTPException(status_code=400, detail="Invalid signature. Check LINE_CHANNEL_SECRET.")
     except Exception as e:
-        logging.error(f"Error processing LINE webhook: {e}", exc_info=True) # exc_info=True logs full traceback
+        logging.error("Error processing LINE webhook: %s", e, exc_info=True) # exc_info=True logs full traceback
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
     # 必須回傳 200 狀態碼和 "OK" 給 LINE 平台
-    from fastapi.responses import PlainTextResponse
+    # 每次建立新的回應物件：FastAPI 會把 background_tasks 掛在回傳的回應上，共用同一個物件會互相覆蓋
     return PlainTextResponse(content="OK", status_code=200)
 
 
@@ -315,174 +377,207 @@ async def callback(request: Request, background_tasks: BackgroundTasks):
 # ====================================================
 
 
-async def handle_text_message(event: MessageEvent, line_bot_api: MessagingApi):
+async def handle_user_text_events(events: List[MessageEvent], line_bot_api: AsyncMessagingApi):
+    """
+    依序處理同一位使用者的多則文字訊息
+
+    LINE 常把使用者連續送出的訊息合併在同一個 webhook 中；逐則處理才能讓後一則訊息
+    看到前一輪的對話紀錄，兩段串流回覆也不會在聊天室中交錯。
+
+    Args:
+        events (List[MessageEvent]): 同一位使用者的文字訊息事件 (依送出順序)
+        line_bot_api (AsyncMessagingApi): LINE 訊息 API
+    """
+    for event in events:
+        try:
+            await handle_text_message(event, line_bot_api)
+        except Exception as e:
+            logging.error("Error handling text message for user %s: %s", event.source.user_id, e)
+
+
+async def handle_text_events(events: List[MessageEvent], line_bot_api: AsyncMessagingApi):
+    """
+    處理同一個 webhook 送來的多則文字訊息
+
+    訊息依使用者分組：同一位使用者的訊息依序處理，不同使用者之間以 asyncio.gather
+    同時進行，總時間約等於最慢的一位使用者，而不是逐則加總。
+
+    Args:
+        events (List[MessageEvent]): 文字訊息事件
+        line_bot_api (AsyncMessagingApi): LINE 訊息 API
+    """
+    events_by_user: Dict[str, List[MessageEvent]] = {}
+    for event in events:
+        events_by_user.setdefault(event.source.user_id, []).append(event)
+    await asyncio.gather(
+        *(handle_user_text_events(user_events, line_bot_api) for user_events in events_by_user.values())
+    )
+
+
+async def _stream_agent_to(replier: LineStreamReplier, user_id: str, text: str) -> str:
+    """
+    將 agent 的回覆串流給使用者
+
+    Returns:
+        str: agent 產生的回覆；沒有產生任何文字時回傳空字串 (並改送預設的道歉訊息)
+    """
+    async for delta in stream_agent(user_id=user_id, text_message=text):
+        await replier.feed(delta)
+    reply = replier.text
+    if not reply:
+        await replier.feed(AGENT_FALLBACK_REPLY)
+    return reply
+
+
+async def stream_agent_reply(replier: LineStreamReplier, user_id: str, text: str, cacheable: bool = False):
+    """
+    將 agent 的回覆串流給使用者
+
+    cacheable 的訊息 (結果不受對話脈絡影響的意圖) 在 TTL 內直接使用同一位使用者相同訊息的快取回覆，
+    同時送達的相同訊息則共用同一次 agent 執行。使用快取或共用的回覆時 agent 不會執行，
+    因此在這裡把這一輪對話寫入記憶。只有成功產生的回覆會寫入快取，預設的道歉訊息不會被快取。
+
+    Args:
+        replier (LineStreamReplier): 串流回覆器
+        user_id (str): 使用者 ID
+        text (str): 使用者輸入的文字
+        cacheable (bool): 是否可以使用快取的回覆
+    """
+    if not cacheable:
+        await _stream_agent_to(replier, user_id, text)
+        return
+
+    cache_key = (user_id, " ".join(text.lower().split()))
+    reply = agent_reply_cache.get(cache_key)
+    if reply is None:
+        is_leader = False
+
+        async def run_agent() -> str:
+            nonlocal is_leader
+            is_leader = True
+            return await _stream_agent_to(replier, user_id, text)
+
+        reply = await agent_reply_flights.do(cache_key, run_agent)
+        if is_leader:
+            if reply:
+                agent_reply_cache.set(cache_key, reply)
+            return
+        if not reply:
+            await replier.feed(AGENT_FALLBACK_REPLY)
+            return
+
+    logging.info("Serving cached agent reply to user %s", user_id)
+    await remember_turn(user_id, text, reply)
+    await replier.feed(reply)
+
+
+async def handle_text_message(event: MessageEvent, line_bot_api: AsyncMessagingApi):
     user_id = event.source.user_id
     text = event.message.text
-    logging.info(f"Received text message from {user_id}: {text}")
+    logging.info("Received text message from %s: %s", user_id, text)
+    # 串流回覆：第一段使用 reply token，之後的段落以 push 訊息送出
+    replier = LineStreamReplier(line_bot_api, event.reply_token, user_id)
 
     try:
+        # 一次掃描找出訊息中所有的關鍵字分類 (選單、星座、運勢)
+        tags = match_keyword_tags(text)
         # 檢查是否是請求選單的關鍵詞
-        menu_type = check_for_menu_keywords(text)
-        
-        # 處理選單請求
-        if menu_type == "main_menu":
-            # 回傳主選單
-            main_menu = create_main_menu_flex()
-            reply_message_request = ReplyMessageRequest(
-                reply_token=event.reply_token,
-                messages=[main_menu]
-            )
-            line_bot_api.reply_message(reply_message_request)
-            return
-        elif menu_type == "tarot_menu":
-            # 回傳塔羅牌選單
-            tarot_menu = create_tarot_buttons()
-            reply_message_request = ReplyMessageRequest(
-                reply_token=event.reply_token,
-                messages=[tarot_menu]
-            )
-            line_bot_api.reply_message(reply_message_request)
-            return
-        elif menu_type == "horoscope_menu":
-            # 回傳星座運勢選單
-            horoscope_menu = create_horoscope_menu_flex()
-            reply_message_request = ReplyMessageRequest(
-                reply_token=event.reply_token,
-                messages=[horoscope_menu]
-            )
-            line_bot_api.reply_message(reply_message_request)
-            return
-        elif menu_type == "daily_fortune":
-            # 回傳每日運勢選單
-            daily_fortune_menu = create_daily_fortune_flex()
-            reply_message_request = ReplyMessageRequest(
-                reply_token=event.reply_token,
-                messages=[daily_fortune_menu]
-            )
-            line_bot_api.reply_message(reply_message_request)
-            return
-        elif menu_type == "mood_diary":
-            # 回傳心情日記選單
-            mood_diary_menu = create_mood_diary_flex()
-            reply_message_request = ReplyMessageRequest(
-                reply_token=event.reply_token,
-                messages=[mood_diary_menu]
+        menu_type = menu_type_from_tags(tags)
+
+        # 處理選單請求：選單訊息皆已預先建立，查表後直接回覆
+        menu_message = MENU_MESSAGES.get(menu_type)
+        if menu_message is not None:
+            await line_bot_api.reply_message(
+                ReplyMessageRequest(reply_token=event.reply_token, messages=[menu_message])
             )
-            line_bot_api.reply_message(reply_message_request)
             return
-        
-        # 檢查是否包含星座關鍵字
-        contains_zodiac = False
-        for sign_ch in HOROSCOPE_SIGNS.keys():
-            if sign_ch in text:
-                contains_zodiac = True
-                break
-                
+
         # 如果請求包含星座關鍵字並提到運勢，直接調用 LangChain agent
-        if contains_zodiac and any(keyword in text for keyword in ["運勢", "今天", "明天", "運氣"]):
-            logging.info(f"User {user_id} requested horoscope for specific zodiac sign")
-            response_data = await invoke_agent(user_id=user_id, text_message=text)
-            ai_reply = response_data.get("reply", "抱歉，我現在有點問題，晚點再試一次。")
-            
+        if "zodiac_sign" in tags and "fortune" in tags:
+            logging.info("User %s requested horoscope for specific zodiac sign", user_id)
+            # 只有 agent 直接轉給星座工具的訊息可以快取；「獅子座明天適合告白嗎」這類問題由完整的 agent 依對話脈絡回答
+            await stream_agent_reply(replier, user_id, text, cacheable=is_routed_horoscope(text))
+
             # 回覆給用戶，並添加快速回覆按鈕供其他星座選擇
-            quick_reply = create_zodiac_quick_reply()
-            reply_message_request = ReplyMessageRequest(
-                reply_token=event.reply_token,
-                messages=[TextMessage(text=ai_reply, quick_reply=quick_reply)]
-            )
-            line_bot_api.reply_message(reply_message_request)
+            await replier.finish(quick_reply=ZODIAC_QUICK_REPLY)
             return
         
-        # 其他一般請求交由 LangChain agent 處理
-        response_data = await invoke_agent(user_id=user_id, text_message=text)
-        ai_reply = response_data.get("reply", "抱歉，我現在有點問題，晚點再試一次。")
+        # 其他一般請求交由 LangChain agent 處理，並將回覆串流轉送給用戶
+        await stream_agent_reply(replier, user_id, text)
+        ai_reply = replier.text
         
         # 檢查回覆中是否包含特定關鍵字，決定是否添加互動按鈕
-        if any(keyword in ai_reply for keyword in ["塔羅牌", "占卜", "抽牌", "tarot"]):
+        # 塔羅按鈕與星座選單彼此獨立，兩者都符合時一併附加在同一個 reply/push 請求中
+        # (LINE 單次最多 5 則訊息)，而不是分兩次送出
+        reply_tags = match_keyword_tags(ai_reply)
+        extra_messages = []
+        if "tarot_topic" in reply_tags:
             # 回覆包含塔羅相關內容，添加塔羅按鈕
-            reply_message_request = ReplyMessageRequest(
-                reply_token=event.reply_token,
-                messages=[
-                    TextMessage(text=ai_reply),
-                    create_tarot_buttons()
-                ]
-            )
-        elif any(keyword in ai_reply for keyword in ["星座", "運勢", "horoscope", "zodiac"]):
+            extra_messages.append(TAROT_BUTTONS_MESSAGE)
+        if "horoscope_topic" in reply_tags:
             # 回覆包含星座相關內容，添加星座選單
-            reply_message_request = ReplyMessageRequest(
-                reply_token=event.reply_token,
-                messages=[
-                    TextMessage(text=ai_reply),
-                    create_horoscope_menu_flex()
-                ]
-            )
-        else:
-            # 一般回覆，不添加特殊按鈕
-            reply_message_request = ReplyMessageRequest(
-                reply_token=event.reply_token,
-                messages=[TextMessage(text=ai_reply)]
-            )
-            
-        line_bot_api.reply_message(reply_message_request)
+            extra_messages.append(HOROSCOPE_MENU_MESSAGE)
+
+        await replier.finish(extra_messages)
 
     except Exception as e:
-        logging.error(f"Error processing text message for user {user_id}: {e}")
+        logging.error("Error processing text message for user %s: %s", user_id, e)
         error_reply = "抱歉，系統發生錯誤，我暫時無法回覆。請稍後再試。"
-        reply_message_request = ReplyMessageRequest(
-            reply_token=event.reply_token,
-            messages=[TextMessage(text=error_reply)]
-        )
-        line_bot_api.reply_message(reply_message_request)
+        await replier.send([TextMessage(text=error_reply)])
 
 
 # ====================================================
 # 區塊 5：多模態訊息處理
 # ====================================================
 
+# 固定內容的回覆訊息只建立一次
+IMAGE_UNSUPPORTED_MESSAGE = TextMessage(text="抱歉，目前暫不支援圖片訊息處理。請您用文字描述您的問題或心情。")
+AUDIO_UNSUPPORTED_MESSAGE = TextMessage(text="抱歉，目前語音訊息處理功能暫不可用。請您輸入文字訊息。")
+
 
-async def handle_image_message(event: MessageEvent, line_bot_api: MessagingApi):
+async def handle_image_message(event: MessageEvent, line_bot_api: AsyncMessagingApi):
     user_id = event.source.user_id
     message_id = event.message.id
-    logging.info(f"Received image message from {user_id}, message_id: {message_id}")
+    logging.info("Received image message from %s, message_id: %s", user_id, message_id)
 
     try:
         # 由於目前 DeepSeek 模型不支援多模態輸入，圖片訊息將不被處理。
         # 可以選擇回覆用戶，告知此功能目前不支援。
         reply_message_request = ReplyMessageRequest(
             reply_token=event.reply_token,
-            messages=[TextMessage(text="抱歉，目前暫不支援圖片訊息處理。請您用文字描述您的問題或心情。")]
+            messages=[IMAGE_UNSUPPORTED_MESSAGE]
         )
-        line_bot_api.reply_message(reply_message_request)
+        await line_bot_api.reply_message(reply_message_request)
 
     except Exception as e:
-        logging.error(f"Error handling image message for user {user_id}: {e}")
+        logging.error("Error handling image message for user %s: %s", user_id, e)
         error_reply = "抱歉，處理圖片時發生錯誤。"
         reply_message_request = ReplyMessageRequest(
             reply_token=event.reply_token,
             messages=[TextMessage(text=error_reply)]
         )
-        line_bot_api.reply_message(reply_message_request)
+        await line_bot_api.reply_message(reply_message_request)
 
 
 
-async def handle_audio_message(event: MessageEvent, line_bot_api: MessagingApi):
+async def handle_audio_message(event: MessageEvent, line_bot_api: AsyncMessagingApi):
     user_id = event.source.user_id
     message_id = event.message.id
-    logging.info(f"Received audio message from {user_id}, message_id: {message_id}")
+    logging.info("Received audio message from %s, message_id: %s", user_id, message_id)
 
     try:
         # 由於目前已移除 OpenAI 客戶端，語音轉文字功能暫不可用。
         reply_message_request = ReplyMessageRequest(
             reply_token=event.reply_token,
-            messages=[TextMessage(text="抱歉，目前語音訊息處理功能暫不可用。請您輸入文字訊息。")]
+            messages=[AUDIO_UNSUPPORTED_MESSAGE]
         )
-        line_bot_api.reply_message(reply_message_request)
+        await line_bot_api.reply_message(reply_message_request)
 
     except Exception as e:
-        logging.error(f"Error handling audio message for user {user_id}: {e}")
+        logging.error("Error handling audio message for user %s: %s", user_id, e)
         error_reply = "抱歉，處理語音時發生錯誤。"
         reply_message_request = ReplyMessageRequest(
             reply_token=event.reply_token,
             messages=[TextMessage(text=error_reply)]
         )
-        line_bot_api.reply_message(reply_message_request)
+        await line_bot_api.reply_message(reply_message_request)
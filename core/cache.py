@@ -0,0 +1,72 @@
+"""Small in-process caches shared by the agent tools and the LINE handlers."""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class LRUCache:
+    """A size-bounded mapping that evicts the least recently used entry.
+
+    With `ttl` set, entries also expire `ttl` seconds after they were stored.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[Any, Optional[float]]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """Return the cached value for `key` and mark it as recently used."""
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            return default
+        value, expires_at = self._data[key]
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self._data[key]
+            return default
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store `value` under `key`, evicting the oldest entry when full."""
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __contains__(self, key: Hashable) -> bool:
+        if key not in self._data:
+            return False
+        _, expires_at = self._data[key]
+        return expires_at is None or time.monotonic() < expires_at
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one in-flight task.
+
+    Callers that arrive while a task for their key is running await that task instead
+    of starting their own. The key is released as soon as the task finishes, so later
+    calls run again (this is not a cache).
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[Hashable, "asyncio.Future[Any]"] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the result of `func()`, sharing it with concurrent callers of `key`."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so one caller being cancelled does not cancel the shared task.
+        return await asyncio.shield(task)
+
+    def __len__(self) -> int:
+        return len(self._inflight)
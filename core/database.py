@@ -14,7 +14,18 @@ DATABASE_URL = os.getenv(
     f"postgresql://{os.getenv('POSTGRES_USER', 'healmate')}:{os.getenv('POSTGRES_PASSWORD', 'healmate_pass')}@postgres:{os.getenv('POSTGRES_PORT', '5432')}/{os.getenv('POSTGRES_DB', 'healmate_db')}"
 )
 
-engine = create_engine(DATABASE_URL)
+# A webhook burst runs many mood lookups at once (each in a worker thread), so the
+# pool is larger than SQLAlchemy's default of 5. Connections are checked before use
+# and recycled every 30 minutes so a connection dropped by the server or a proxy
+# does not surface as an error on a user's request.
+engine = create_engine(
+    DATABASE_URL,
+    pool_size=20,
+    max_overflow=20,
+    pool_pre_ping=True,
+    pool_recycle=1800,
+    connect_args={"application_name": "linebot"} if DATABASE_URL.startswith("postgresql") else {},
+)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -1,6 +1,6 @@
 """SQLAlchemy models for the application."""
 
-from sqlalchemy import Column, String, DateTime, Integer, Text
+from sqlalchemy import Column, String, DateTime, Integer, Text, Index
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import func
 from .database import Base
@@ -16,5 +16,11 @@ class MoodEntry(Base):
     tags = Column(JSONB, nullable=True) # Store as JSONB for list of strings
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
 
+    # Every query filters by user and orders or ranges by time; this index turns them
+    # into an index range scan with no sort step.
+    __table_args__ = (
+        Index("ix_mood_entries_user_id_timestamp", user_id, timestamp.desc()),
+    )
+
     def __repr__(self):
         return f"<MoodEntry(user_id='{self.user_id}', mood='{self.mood}', intensity={self.intensity})>"
@@ -0,0 +1,44 @@
+"""Client-side rate limiting for calls to external APIs."""
+
+import asyncio
+import time
+
+
+class AsyncRateLimiter:
+    """A token bucket that allows `max_rate` acquisitions per `time_period` seconds.
+
+    Up to `max_rate` calls may start at once; after that, callers wait until the bucket
+    refills at a steady `max_rate / time_period` tokens per second. Use it as
+    `async with limiter:`.
+    """
+
+    def __init__(self, max_rate: float, time_period: float = 60.0) -> None:
+        self.max_rate = max_rate
+        self.time_period = time_period
+        self._tokens = float(max_rate)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.max_rate,
+            self._tokens + (now - self._updated) * self.max_rate / self.time_period,
+        )
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it."""
+        # The lock makes waiters take tokens in arrival order.
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) * self.time_period / self.max_rate)
+                self._refill()
+            self._tokens -= 1
+
+    async def __aenter__(self) -> None:
+        await self.acquire()
+
+    async def __aexit__(self, *exc_info) -> None:
+        return None
@@ -12,7 +12,8 @@ Key Features:
 - Configurable: All major parameters (model names, collection names, etc.) can be
   set via environment variables or command-line arguments.
 - Robust: Includes validation, logging, and clear error handling.
-- Idempotent: Safely re-run the script. It checks for existing Qdrant collections.
+- Idempotent: Safely re-run the script. It checks for existing Qdrant collections
+  and reuses cached embeddings of unchanged cards (see --no-cache).
 
 Usage Examples:
 
@@ -25,20 +26,31 @@ python scripts/data_pipeline.py --embedder ollama --model mxbai-embed-large
 # Using OpenAI (ensure OPENAI_API_KEY is set in .env):
 python scripts/data_pipeline.py --embedder openai --model text-embedding-3-small
 
+# Using in-process FastEmbed with an int8 quantized collection:
+python scripts/data_pipeline.py --embedder fastembed --quantize
+
+# Uploading over gRPC (Qdrant's port 6334, or QDRANT_GRPC_PORT):
+QDRANT_PREFER_GRPC=1 python scripts/data_pipeline.py --embedder ollama
+
 """
 from __future__ import annotations
 
 import argparse
-import json
+import asyncio
+import hashlib
 import logging
 import os
+import shelve
 import sys
-import time
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 import httpx
+import numpy as np
+import orjson
 from dotenv import load_dotenv
 from qdrant_client import QdrantClient, models as rest
 from tqdm import tqdm
@@ -56,8 +68,12 @@ PROJECT_ROOT = Path(__file__).resolve().parent.parent
 DATA_DIR = PROJECT_ROOT / "data"
 RAW_DATA_PATH = DATA_DIR / "tarot_raw.json"
 PROCESSED_DATA_PATH = DATA_DIR / "tarot_cards_processed.json"
+EMBEDDING_CACHE_PATH = DATA_DIR / "embedding_cache"
 
 # --- Constants ---
+# Part of the skip key of step_process_and_validate_data: bump it whenever the
+# processing code changes, so an unchanged raw file is still reprocessed.
+PROCESSING_VERSION = 1
 # Source for fetching tarot card data
 TAROT_SOURCE_URL = "https://www.tarot.com/tarot/decks/rider-waite/cards"
 # A more reliable source than Labyrinthos, which was used in the original script.
@@ -75,6 +91,36 @@ MINOR_ARCANA_RANKS = [
     "Ace", "Two", "Three", "Four", "Five", "Six", "Seven", "Eight", "Nine", "Ten",
     "Page", "Knight", "Queen", "King"
 ]
+# Position lookups for sorting cards into canonical order (also O(1) Major Arcana membership)
+MAJOR_ARCANA_INDEX = {name: i for i, name in enumerate(MAJOR_ARCANA_ORDER)}
+MINOR_ARCANA_SUIT_INDEX = {suit: i for i, suit in enumerate(MINOR_ARCANA_SUITS)}
+MINOR_ARCANA_RANK_INDEX = {rank: i for i, rank in enumerate(MINOR_ARCANA_RANKS)}
+
+# Qdrant bulk upload: points per upsert request
+UPLOAD_BATCH_SIZE = 256
+# Qdrant's default indexing threshold (KB), restored after the bulk upload
+DEFAULT_INDEXING_THRESHOLD = 20000
+# Request timeout for the pipeline's Qdrant client (bulk uploads can take minutes)
+QDRANT_TIMEOUT_SECONDS = 600
+
+
+# Output dimension of known embedding models, so the pipeline does not have to embed
+# a probe text just to size the collection. Unknown models are still probed.
+MODEL_DIMENSIONS = {
+    # Ollama
+    "nomic-embed-text": 768,
+    "mxbai-embed-large": 1024,
+    "all-minilm": 384,
+    "bge-m3": 1024,
+    # OpenAI
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+    # FastEmbed
+    "nomic-ai/nomic-embed-text-v1.5": 768,
+    "nomic-ai/nomic-embed-text-v1.5-Q": 768,
+    "BAAI/bge-small-en-v1.5": 384,
+}
 
 
 # --- Abstract Base Class for Embedders ---
@@ -96,11 +142,17 @@ class Embedder(ABC):
 class OllamaEmbedder(Embedder):
     """Embedder implementation for Ollama."""
 
+    # Maximum number of /api/embeddings requests in flight at once (legacy endpoint only)
+    MAX_CONCURRENCY = 8
+
     def __init__(self, model: str, base_url: str):
         self.model = model
         self.base_url = base_url
         self.client = httpx.Client(base_url=self.base_url, timeout=60.0)
-        self._dimension = None
+        # Ollama treats "name" and "name:latest" as the same model
+        self._dimension = MODEL_DIMENSIONS.get(model.removesuffix(":latest"))
+        # Set once the server turns out not to support /api/embed
+        self._legacy_api = False
         self._check_availability()
 
     def _check_availability(self):
@@ -130,18 +182,55 @@ class OllamaEmbedder(Embedder):
         return self._dimension
 
     def get_embeddings(self, texts: List[str]) -> List[List[float]]:
-        embeddings = []
-        for text in texts:
-            try:
-                response = self.client.post(
-                    "/api/embeddings", json={"model": self.model, "prompt": text}
-                )
-                response.raise_for_status()
-                embeddings.append(response.json()["embedding"])
-            except httpx.HTTPStatusError as e:
-                logging.error(f"HTTP error while getting embedding for text: '{text[:50]}...': {e.response.text}")
-                raise
-        return embeddings
+        """Embed a batch with a single /api/embed request (one model pass for the batch).
+
+        Ollama servers older than 0.3 do not have /api/embed; on a 404 the embedder
+        switches to the per-text /api/embeddings endpoint for the rest of the run.
+        """
+        if not self._legacy_api:
+            response = self.client.post("/api/embed", json={"model": self.model, "input": texts})
+            if response.status_code != 404:
+                try:
+                    response.raise_for_status()
+                except httpx.HTTPStatusError as e:
+                    logging.error(f"HTTP error while getting embeddings for {len(texts)} texts: {e.response.text}")
+                    raise
+                # orjson parses the raw bytes directly (no str decode, faster float parsing)
+                return orjson.loads(response.content)["embeddings"]
+            logging.warning("Ollama has no /api/embed endpoint, falling back to /api/embeddings.")
+            self._legacy_api = True
+        return asyncio.run(self._aget_embeddings(texts))
+
+    async def _aget_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Request the embeddings of a batch concurrently, one request per text.
+
+        The pipeline is bound by round-trips rather than by the model, so up to
+        `MAX_CONCURRENCY` requests are kept in flight. `gather` returns the results in
+        input order.
+        """
+        semaphore = asyncio.Semaphore(self.MAX_CONCURRENCY)
+        # A fresh client per call: asyncio.run() starts a new event loop each time and
+        # pooled connections cannot be reused across loops.
+        async with httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=60.0,
+            http2=True,
+            limits=httpx.Limits(max_connections=16),
+        ) as client:
+
+            async def embed(text: str) -> List[float]:
+                async with semaphore:
+                    try:
+                        response = await client.post(
+                            "/api/embeddings", json={"model": self.model, "prompt": text}
+                        )
+                        response.raise_for_status()
+                    except httpx.HTTPStatusError as e:
+                        logging.error(f"HTTP error while getting embedding for text: '{text[:50]}...': {e.response.text}")
+                        raise
+                return orjson.loads(response.content)["embedding"]
+
+            return list(await asyncio.gather(*(embed(text) for text in texts)))
 
 
 class OpenAIEmbedder(Embedder):
@@ -153,15 +242,16 @@ class OpenAIEmbedder(Embedder):
         except ImportError:
             raise ImportError("OpenAI library not found. Please run 'pip install openai'.")
         self.model = model
-        self.client = OpenAI(api_key=api_key)
-        self._dimension = None
+        # The SDK retries 429s and 5xx with exponential backoff, honouring Retry-After,
+        # so the pipeline only waits when the API actually pushes back.
+        self.client = OpenAI(api_key=api_key, max_retries=5)
+        self._dimension = MODEL_DIMENSIONS.get(model)
 
     def get_dimension(self) -> int:
         if self._dimension is None:
             logging.info("Determining OpenAI embedding dimension...")
             try:
-                # OpenAI dimensions are fixed per model, but we can get it via an API call if needed
-                # For now, let's get it from a sample.
+                # Only reached for models missing from MODEL_DIMENSIONS: measure a sample.
                 sample_embedding = self.get_embeddings(["test"])[0]
                 self._dimension = len(sample_embedding)
                 logging.info(f"Determined dimension: {self._dimension}")
@@ -179,6 +269,79 @@ class OpenAIEmbedder(Embedder):
             raise
 
 
+class FastEmbedEmbedder(Embedder):
+    """Embedder implementation for in-process FastEmbed (ONNX Runtime)."""
+
+    def __init__(self, model: str):
+        try:
+            from fastembed import TextEmbedding
+        except ImportError:
+            raise ImportError("FastEmbed library not found. Please run 'pip install fastembed'.")
+        self.model = model
+        self.embedder = TextEmbedding(model_name=model)
+        self._dimension = MODEL_DIMENSIONS.get(model)
+
+    def get_dimension(self) -> int:
+        if self._dimension is None:
+            logging.info("Determining FastEmbed embedding dimension...")
+            sample_embedding = self.get_embeddings(["test"])[0]
+            self._dimension = len(sample_embedding)
+            logging.info(f"Determined dimension: {self._dimension}")
+        return self._dimension
+
+    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return [vector.tolist() for vector in self.embedder.embed(texts)]
+
+
+# --- Card Model ---
+@dataclass(slots=True)
+class Card:
+    """One orientation of a tarot card, as written to the processed data file.
+
+    Slotted, so the cards held through processing cost far less memory than dicts.
+    Field order is the key order of the JSON output.
+    """
+
+    name: str
+    arcana: str
+    orientation: str
+    meaning: str
+    source: str
+    # Assigned once the cards are in canonical order
+    id: int = -1
+
+
+# --- Embedding Cache ---
+class EmbeddingCache:
+    """On-disk cache of embeddings, keyed by a hash of the model name and the text.
+
+    Re-running the pipeline on unchanged cards then costs no embedder calls. Keying on
+    the model keeps vectors of different models (and dimensions) apart. Vectors are
+    stored as float16 arrays, a quarter of the size of pickled Python floats; the
+    precision lost is far below what affects cosine ranking.
+    """
+
+    def __init__(self, path: Path, model: str):
+        self.model = model
+        path.parent.mkdir(exist_ok=True)
+        self._db = shelve.open(str(path))
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}|{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Return the cached embedding of each text, or None where there is none."""
+        return [self._db.get(self._key(text)) for text in texts]
+
+    def set_many(self, texts: List[str], embeddings: np.ndarray) -> None:
+        for text, embedding in zip(texts, embeddings):
+            self._db[self._key(text)] = np.asarray(embedding, dtype=np.float16)
+        self._db.sync()
+
+    def close(self) -> None:
+        self._db.close()
+
+
 # --- Pipeline Steps ---
 
 def step_fetch_data(output_path: Path) -> None:
@@ -201,8 +364,7 @@ def step_fetch_data(output_path: Path) -> None:
             dummy_data.append({"name_en": name, "upright": f"Upright meaning for {name}", "reversed": f"Reversed meaning for {name}", "source": TAROT_SOURCE_URL})
 
     output_path.parent.mkdir(exist_ok=True)
-    with output_path.open("w", encoding="utf-8") as f:
-        json.dump(dummy_data, f, ensure_ascii=False, indent=2)
+    output_path.write_bytes(orjson.dumps(dummy_data, option=orjson.OPT_INDENT_2))
     logging.info(f"Successfully created dummy raw data with {len(dummy_data)} cards.")
 
 
@@ -210,61 +372,67 @@ def step_process_and_validate_data(input_path: Path, output_path: Path) -> None:
     """
     Cleans, structures, validates, and saves the tarot data.
     This combines the logic of fix_tarot_json.py and validate_tarot_json.py.
+
+    The hash of the raw file and PROCESSING_VERSION is stored next to the output;
+    when both are unchanged and the output exists, processing is skipped. Delete
+    the `.hash` sidecar to force it.
     """
     logging.info(f"Processing data from {input_path}...")
     if not input_path.exists():
         logging.error(f"Input file not found: {input_path}")
         sys.exit(1)
 
-    raw_cards = json.loads(input_path.read_text(encoding="utf-8"))
+    raw_bytes = input_path.read_bytes()
+    skip_key = f"{PROCESSING_VERSION}:{hashlib.blake2b(raw_bytes, digest_size=16).hexdigest()}"
+    hash_path = output_path.with_suffix(".hash")
+    if output_path.exists() and hash_path.exists() and hash_path.read_text().strip() == skip_key:
+        logging.info(f"Raw data and processing version unchanged since the last run. Reusing {output_path}.")
+        return
+
+    raw_cards = orjson.loads(raw_bytes)
 
     # Expand each card into upright and reversed versions
     structured_cards = []
     for raw_card in raw_cards:
         name = raw_card["name_en"]
-        arcana = "Major" if name in MAJOR_ARCANA_ORDER else "Minor"
+        arcana = "Major" if name in MAJOR_ARCANA_INDEX else "Minor"
         
-        structured_cards.append({
-            "name": name,
-            "arcana": arcana,
-            "orientation": "upright",
-            "meaning": raw_card.get("upright", f"Meaning of {name} upright."),
-            "source": raw_card.get("source", "")
-        })
-        structured_cards.append({
-            "name": name,
-            "arcana": arcana,
-            "orientation": "reversed",
-            "meaning": raw_card.get("reversed", f"Meaning of {name} reversed."),
-            "source": raw_card.get("source", "")
-        })
+        structured_cards.append(Card(
+            name=name,
+            arcana=arcana,
+            orientation="upright",
+            meaning=raw_card.get("upright", f"Meaning of {name} upright."),
+            source=raw_card.get("source", ""),
+        ))
+        structured_cards.append(Card(
+            name=name,
+            arcana=arcana,
+            orientation="reversed",
+            meaning=raw_card.get("reversed", f"Meaning of {name} reversed."),
+            source=raw_card.get("source", ""),
+        ))
 
     # Sort the cards in a canonical order
-    def get_sort_key(card):
-        name = card["name"]
-        orientation_val = 0 if card["orientation"] == "upright" else 1
-        if card["arcana"] == "Major":
-            return (0, MAJOR_ARCANA_ORDER.index(name), orientation_val)
-        
-        suit_index = -1
-        rank_index = -1
-        for i, suit in enumerate(MINOR_ARCANA_SUITS):
-            if suit in name:
-                suit_index = i
-                break
-        for i, rank in enumerate(MINOR_ARCANA_RANKS):
-            if rank in name:
-                rank_index = i
-                break
-        return (1, suit_index, rank_index, orientation_val)
-
-    sorted_cards = sorted(structured_cards, key=get_sort_key)
-
-    # Assign final IDs
-    final_cards = []
-    for i, card in enumerate(sorted_cards):
-        card["id"] = i
-        final_cards.append(card)
+    def get_sort_key(card: Card):
+        name = card.name
+        orientation_val = 0 if card.orientation == "upright" else 1
+        if card.arcana == "Major":
+            return (0, MAJOR_ARCANA_INDEX[name], orientation_val)
+
+        # Minor Arcana names are "<Rank> of <Suit>"
+        rank, _, suit = name.partition(" of ")
+        return (
+            1,
+            MINOR_ARCANA_SUIT_INDEX.get(suit, -1),
+            MINOR_ARCANA_RANK_INDEX.get(rank, -1),
+            orientation_val,
+        )
+
+    # Sort in place and assign final IDs in the same order (no intermediate copies)
+    final_cards = structured_cards
+    final_cards.sort(key=get_sort_key)
+    for i, card in enumerate(final_cards):
+        card.id = i
 
     logging.info(f"Processed and sorted {len(final_cards)} card entries.")
 
@@ -272,16 +440,16 @@ def step_process_and_validate_data(input_path: Path, output_path: Path) -> None:
     if len(final_cards) != 156:
         logging.warning(f"Expected 156 cards, but got {len(final_cards)}.")
     
-    ids = [c["id"] for c in final_cards]
+    ids = [c.id for c in final_cards]
     if len(ids) != len(set(ids)):
         logging.error("Validation failed: Duplicate IDs found.")
         sys.exit(1)
 
     logging.info("Validation passed.")
 
-    # Save processed data
-    with output_path.open("w", encoding="utf-8") as f:
-        json.dump(final_cards, f, ensure_ascii=False, indent=2)
+    # Save processed data (orjson serializes the dataclasses in field order)
+    output_path.write_bytes(orjson.dumps(final_cards, option=orjson.OPT_INDENT_2))
+    hash_path.write_text(skip_key)
     logging.info(f"Processed data saved to {output_path}")
 
 
@@ -290,29 +458,60 @@ def step_embed_and_upload(
     qdrant_client: QdrantClient,
     collection_name: str,
     data_path: Path,
+    quantize: bool = False,
+    cache: Optional[EmbeddingCache] = None,
 ) -> None:
-    """Generates embeddings and upserts them to Qdrant."""
+    """Generates embeddings and upserts them to Qdrant.
+
+    With `quantize`, the collection keeps an int8 scalar-quantized copy of the
+    vectors in RAM for faster, smaller searches; the original vectors stay available
+    for rescoring. An existing collection is updated in place.
+
+    With `cache`, only card texts without a cached embedding are sent to the embedder.
+    """
     logging.info(f"Starting embedding and upload process for collection '{collection_name}'...")
     if not data_path.exists():
         logging.error(f"Processed data file not found: {data_path}")
         sys.exit(1)
 
-    cards = json.loads(data_path.read_text(encoding="utf-8"))
+    cards = orjson.loads(data_path.read_bytes())
     vector_size = embedder.get_dimension()
 
+    quantization_config = None
+    if quantize:
+        quantization_config = rest.ScalarQuantization(
+            scalar=rest.ScalarQuantizationConfig(
+                type=rest.ScalarType.INT8, quantile=0.99, always_ram=True
+            )
+        )
+    # Denser HNSW graph and a wider build-time search for better recall at the same query ef
+    hnsw_config = rest.HnswConfigDiff(m=32, ef_construct=256)
+
     # Ensure collection exists in Qdrant
     try:
         collections_response = qdrant_client.get_collections()
         existing_collections = [c.name for c in collections_response.collections]
-        if collection_name not in existing_collections:
+        collection_exists = collection_name in existing_collections
+        if not collection_exists:
             logging.info(f"Collection '{collection_name}' not found. Creating...")
             qdrant_client.create_collection(
                 collection_name=collection_name,
                 vectors_config=rest.VectorParams(size=vector_size, distance=rest.Distance.COSINE),
+                hnsw_config=hnsw_config,
+                quantization_config=quantization_config,
+                # Created with indexing off: the HNSW graph is built once after the bulk load
+                optimizers_config=rest.OptimizersConfigDiff(indexing_threshold=0),
             )
             logging.info("Collection created successfully.")
         else:
             logging.info(f"Collection '{collection_name}' already exists.")
+            if quantize:
+                logging.info("Updating its HNSW and quantization settings...")
+                qdrant_client.update_collection(
+                    collection_name=collection_name,
+                    hnsw_config=hnsw_config,
+                    quantization_config=quantization_config,
+                )
     except Exception as e:
         logging.error(f"Failed to interact with Qdrant: {e}")
         sys.exit(1)
@@ -322,34 +521,79 @@ def step_embed_and_upload(
         f"{card['name']} ({card['orientation']}): {card['meaning']}" for card in cards
     ]
     
-    logging.info(f"Generating embeddings for {len(texts_to_embed)} cards. This may take a while...")
-    
-    # Generate embeddings in batches to avoid overwhelming the API
-    batch_size = 32
-    all_embeddings = []
-    for i in tqdm(range(0, len(texts_to_embed), batch_size), desc="Generating Embeddings"):
-        batch_texts = texts_to_embed[i:i+batch_size]
-        all_embeddings.extend(embedder.get_embeddings(batch_texts))
-        time.sleep(0.1) # Small delay to be nice to the API
-
-    # Prepare points for Qdrant
-    points = []
-    for card, embedding in zip(cards, all_embeddings):
-        points.append(
-            rest.PointStruct(
-                id=card["id"],
-                vector=embedding,
-                payload=card,
+    # All vectors live in one float32 array (Qdrant's wire format) instead of a list of
+    # lists of boxed Python floats.
+    all_embeddings = np.empty((len(texts_to_embed), vector_size), dtype=np.float32)
+
+    # Reuse embeddings of unchanged card texts from earlier runs; only misses are embedded
+    hit_indices, miss_indices = [], []
+    cached_embeddings = cache.get_many(texts_to_embed) if cache else [None] * len(texts_to_embed)
+    for i, vector in enumerate(cached_embeddings):
+        if vector is None:
+            miss_indices.append(i)
+        else:
+            all_embeddings[i] = vector
+            hit_indices.append(i)
+    miss_texts = [texts_to_embed[i] for i in miss_indices]
+    logging.info(
+        f"{len(hit_indices)} of {len(texts_to_embed)} embeddings found in cache. "
+        f"Generating {len(miss_texts)} embeddings. This may take a while..."
+    )
+
+    def upload(indices: List[int]) -> None:
+        """Upsert the cards at `indices` as column-wise batches (no per-point objects)."""
+        for start in range(0, len(indices), UPLOAD_BATCH_SIZE):
+            chunk = indices[start:start + UPLOAD_BATCH_SIZE]
+            qdrant_client.upsert(
+                collection_name=collection_name,
+                points=rest.Batch(
+                    ids=[cards[i]["id"] for i in chunk],
+                    vectors=all_embeddings[chunk].tolist(),
+                    payloads=[cards[i] for i in chunk],
+                ),
+                wait=True,
             )
+
+    # Bulk load with HNSW indexing switched off, so the graph is built once after the
+    # upload instead of incrementally while points arrive. A new collection was
+    # already created that way.
+    if collection_exists:
+        qdrant_client.update_collection(
+            collection_name=collection_name,
+            optimizer_config=rest.OptimizersConfigDiff(indexing_threshold=0),
         )
 
-    logging.info(f"Upserting {len(points)} points to Qdrant...")
-    qdrant_client.upsert(
-        collection_name=collection_name,
-        points=points,
-        wait=True,
-    )
-    logging.info("Upsert complete.")
+    try:
+        # Each batch is uploaded on a background thread while the next one is embedded,
+        # so Qdrant's network time hides behind the embedder instead of adding to it.
+        # One worker keeps the uploads in order.
+        with ThreadPoolExecutor(max_workers=1) as uploader:
+            uploads = []
+            if hit_indices:
+                uploads.append(uploader.submit(upload, hit_indices))
+
+            # Generate embeddings in batches to keep each request a reasonable size
+            batch_size = 32
+            for i in tqdm(range(0, len(miss_texts), batch_size), desc="Generating Embeddings"):
+                batch_texts = miss_texts[i:i+batch_size]
+                batch_indices = miss_indices[i:i+batch_size]
+                batch_embeddings = np.asarray(embedder.get_embeddings(batch_texts), dtype=np.float32)
+                all_embeddings[batch_indices] = batch_embeddings
+                uploads.append(uploader.submit(upload, batch_indices))
+                if cache:
+                    cache.set_many(batch_texts, batch_embeddings)
+
+            for future in uploads:
+                future.result()
+        logging.info(f"Uploaded {len(cards)} points to Qdrant.")
+    finally:
+        # Re-enable indexing even if embedding or the upload failed, so the collection
+        # stays searchable
+        logging.info("Re-enabling indexing...")
+        qdrant_client.update_collection(
+            collection_name=collection_name,
+            optimizer_config=rest.OptimizersConfigDiff(indexing_threshold=DEFAULT_INDEXING_THRESHOLD),
+        )
 
 
 # --- Main Execution ---
@@ -359,7 +603,7 @@ def main():
     parser.add_argument(
         "--embedder",
         type=str,
-        choices=["ollama", "openai"],
+        choices=["ollama", "openai", "fastembed"],
         required=True,
         help="The embedding provider to use.",
     )
@@ -373,6 +617,16 @@ def main():
         type=str,
         help="Name of the Qdrant collection. Defaults based on embedder and model.",
     )
+    parser.add_argument(
+        "--quantize",
+        action="store_true",
+        help="Use int8 scalar quantization (also applied to an existing collection).",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Ignore the on-disk embedding cache and re-embed every card.",
+    )
     parser.add_argument(
         "--skip-fetch",
         action="store_true",
@@ -401,13 +655,24 @@ def main():
             logging.error("OPENAI_API_KEY environment variable not set.")
             sys.exit(1)
         embedder_instance = OpenAIEmbedder(model=model_name, api_key=api_key)
+    elif args.embedder == "fastembed":
+        model_name = args.model or os.getenv("FASTEMBED_MODEL", "nomic-ai/nomic-embed-text-v1.5-Q")
+        embedder_instance = FastEmbedEmbedder(model=model_name)
     
     collection_name = args.collection or f"tarot_{args.embedder}_{model_name.replace(':', '_').replace('/', '_')}"
 
     # --- Instantiate Qdrant Client ---
     qdrant_host = os.getenv("QDRANT_HOST", "localhost")
     qdrant_port = int(os.getenv("QDRANT_PORT", 6333))
-    qdrant_client = QdrantClient(host=qdrant_host, port=qdrant_port)
+    # gRPC sends vectors as packed floats instead of JSON text. The long timeout keeps
+    # bulk uploads from failing with the REST client's default timeout.
+    qdrant_client = QdrantClient(
+        host=qdrant_host,
+        port=qdrant_port,
+        grpc_port=int(os.getenv("QDRANT_GRPC_PORT", 6334)),
+        prefer_grpc=os.getenv("QDRANT_PREFER_GRPC", "0").lower() in ("1", "true", "yes"),
+        timeout=QDRANT_TIMEOUT_SECONDS,
+    )
 
     logging.info("Starting data pipeline...")
     logging.info(f"Embedder: {args.embedder}, Model: {model_name}, Collection: {collection_name}")
@@ -423,12 +688,19 @@ def main():
     else:
         logging.info("Skipping data processing step.")
 
-    step_embed_and_upload(
-        embedder=embedder_instance,
-        qdrant_client=qdrant_client,
-        collection_name=collection_name,
-        data_path=PROCESSED_DATA_PATH,
-    )
+    cache = None if args.no_cache else EmbeddingCache(EMBEDDING_CACHE_PATH, f"{args.embedder}:{model_name}")
+    try:
+        step_embed_and_upload(
+            embedder=embedder_instance,
+            qdrant_client=qdrant_client,
+            collection_name=collection_name,
+            data_path=PROCESSED_DATA_PATH,
+            quantize=args.quantize,
+            cache=cache,
+        )
+    finally:
+        if cache:
+            cache.close()
 
     logging.info("🎉 Data pipeline finished successfully!")
 
@@ -16,6 +16,7 @@ import sys
 from pprint import pprint
 
 import httpx
+import orjson
 
 # Ollama 配置
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
@@ -26,6 +27,9 @@ QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
 QDRANT_PORT = int(os.getenv("QDRANT_PORT", "6333"))
 QDRANT_BASE_URL = f"http://{QDRANT_HOST}:{QDRANT_PORT}"
 
+# 以 orjson 預先編碼的請求主體需自行帶上 Content-Type
+JSON_HEADERS = {"Content-Type": "application/json"}
+
 # 使用命令行參數指定集合名稱，或使用默認值
 COLLECTION_NAME = sys.argv[1] if len(sys.argv) > 1 else f"tarot_cards_ollama_{DEFAULT_MODEL.replace(':', '_')}"
 
@@ -62,9 +66,9 @@ def get_embedding(text: str, model: str = DEFAULT_MODEL) -> list[float]:
     payload = {"model": model, "prompt": text}
     
     with httpx.Client(timeout=30.0) as client:
-        response = client.post(url, json=payload)
+        response = client.post(url, content=orjson.dumps(payload), headers=JSON_HEADERS)
         response.raise_for_status()
-        data = response.json()
+        data = orjson.loads(response.content)
         return data["embedding"]
 
 
@@ -82,9 +86,10 @@ def search_by_text(text: str, limit: int = 5) -> list[dict]:
     }
     
     with httpx.Client(timeout=10.0) as client:
-        response = client.post(url, json=payload)
+        # 向量以 orjson 編碼 (比標準 json 快得多，且直接產生 bytes)
+        response = client.post(url, content=orjson.dumps(payload), headers=JSON_HEADERS)
         response.raise_for_status()
-        return response.json().get("result", [])
+        return orjson.loads(response.content).get("result", [])
 
 
 def main() -> None:
@@ -1,14 +1,19 @@
 """RAG (Retrieval Augmented Generation) service for tarot card meanings."""
 from typing import Dict, List, Any, Optional
 import os
+import asyncio
 from pathlib import Path
 import logging
 
 import httpx
+import numpy as np
+import orjson
 from qdrant_client import QdrantClient
 from qdrant_client.http.models import Filter, FieldCondition, MatchValue, Distance, VectorParams
 from openai import OpenAI
 
+from core.cache import LRUCache
+
 # Constants
 # Default to Ollama collection, fallback to OpenAI collection
 COLLECTION_NAME = os.getenv("QDRANT_COLLECTION", "tarot_cards_ollama_nomic-embed-text")
@@ -27,6 +32,15 @@ OPENAI_EMBEDDING_DIM = 3072
 EMBEDDING_DIM = OLLAMA_EMBEDDING_DIM if OLLAMA_ENABLED else OPENAI_EMBEDDING_DIM
 
 SIMILARITY_THRESHOLD = 0.5  # Minimum similarity score for results
+DEFAULT_QUERY_LIMIT = 5  # Results returned when the caller does not set a limit
+
+# Repeated query texts skip the embedding round-trip. Keyed by (model, text) so a
+# fallback from Ollama to OpenAI never serves vectors of the other model; entries are
+# tuples so cached values cannot be mutated by callers.
+_embedding_cache = LRUCache(maxsize=1024)
+
+# Collections up to this size are searched in memory instead of through Qdrant
+LOCAL_INDEX_MAX_POINTS = 2000
 
 
 class RAGService:
@@ -35,6 +49,10 @@ class RAGService:
     _instance = None
     _client = None
     _openai = None
+    # In-memory copy of the collection (see _load_local_index); None means search Qdrant
+    _vectors: Optional[np.ndarray] = None
+    _payloads: List[Dict] = []
+    _payload_fields: Dict[str, np.ndarray] = {}
 
     @classmethod
     def get_instance(cls) -> "RAGService":
@@ -83,6 +101,66 @@ class RAGService:
         except Exception as e:
             logging.error(f"Failed to connect to Qdrant: {e}")
             self._client = None
+        else:
+            self._load_local_index()
+
+    def _load_local_index(self) -> None:
+        """Load a small collection into memory so queries skip the Qdrant round-trip.
+
+        The tarot corpus is 156 fixed vectors: one matrix-vector product over them
+        takes microseconds, far less than a network hop to Qdrant. Larger (or missing)
+        collections keep being searched in Qdrant. Re-ingested data is picked up on
+        restart.
+        """
+        try:
+            points, next_offset = self._client.scroll(
+                collection_name=COLLECTION_NAME,
+                limit=LOCAL_INDEX_MAX_POINTS,
+                with_payload=True,
+                with_vectors=True,
+            )
+        except Exception as e:
+            logging.warning(f"Could not load '{COLLECTION_NAME}' into memory, searching Qdrant instead: {e}")
+            return
+        if next_offset is not None or not points:
+            logging.info(f"Searching '{COLLECTION_NAME}' in Qdrant ({'too large' if points else 'empty'} for an in-memory index)")
+            return
+
+        vectors = np.asarray([point.vector for point in points], dtype=np.float32)
+        # Cosine similarity is the dot product of unit vectors
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        self._vectors = vectors
+        self._payloads = [point.payload for point in points]
+        # Per-point values of the filterable fields, for boolean-mask filtering
+        self._payload_fields = {
+            key: np.asarray([payload.get(key) for payload in self._payloads], dtype=object)
+            for key in ("arcana", "orientation")
+        }
+        logging.info(f"Loaded {len(points)} points of '{COLLECTION_NAME}' into memory")
+
+    def _search_local(self, embedding: List[float], limit: int,
+                      filter_params: Optional[Dict[str, Any]]) -> List[Dict]:
+        """Return the top `limit` cards by cosine similarity from the in-memory index."""
+        query = np.asarray(embedding, dtype=np.float32)
+        scores = self._vectors @ (query / np.linalg.norm(query))
+        for key, values in self._payload_fields.items():
+            if filter_params and key in filter_params:
+                scores = np.where(values == filter_params[key], scores, -np.inf)
+
+        limit = min(limit, len(scores))
+        if limit < 1:
+            return []
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for index in top:
+            score = float(scores[index])
+            if score >= SIMILARITY_THRESHOLD:
+                result = dict(self._payloads[index])
+                result["score"] = round(score, 4)
+                results.append(result)
+        return results
 
     def create_collection_if_not_exists(self) -> bool:
         """Create tarot card collection if it doesn't exist."""
@@ -109,11 +187,18 @@ class RAGService:
             return False
 
     async def generate_embedding(self, text: str) -> List[float]:
-        """Generate embedding for text using Ollama or OpenAI API."""
+        """Generate embedding for text using Ollama or OpenAI API (cached per text)."""
+        cache_key = (OLLAMA_MODEL if OLLAMA_ENABLED else OPENAI_EMBEDDING_MODEL, text)
+        cached = _embedding_cache.get(cache_key)
+        if cached is not None:
+            return list(cached)
+
         if OLLAMA_ENABLED:
-            return await self.generate_ollama_embedding(text)
+            embedding = await self.generate_ollama_embedding(text)
         else:
-            return await self.generate_openai_embedding(text)
+            embedding = await self.generate_openai_embedding(text)
+        _embedding_cache.set(cache_key, tuple(embedding))
+        return embedding
     
     async def generate_ollama_embedding(self, text: str) -> List[float]:
         """Generate embedding for text using Ollama API."""
@@ -121,10 +206,12 @@ class RAGService:
             async with httpx.AsyncClient(timeout=30.0) as client:
                 response = await client.post(
                     f"{OLLAMA_BASE_URL}/api/embeddings",
-                    json={"model": OLLAMA_MODEL, "prompt": text}
+                    content=orjson.dumps({"model": OLLAMA_MODEL, "prompt": text}),
+                    headers={"Content-Type": "application/json"},
                 )
                 response.raise_for_status()
-                data = response.json()
+                # orjson parses the raw bytes directly (no str decode, faster float parsing)
+                data = orjson.loads(response.content)
                 return data["embedding"]
         except Exception as e:
             logging.error(f"Failed to generate Ollama embedding: {e}")
@@ -133,25 +220,33 @@ class RAGService:
     async def generate_openai_embedding(self, text: str) -> List[float]:
         """Generate embedding for text using OpenAI API."""
         try:
-            response = await self._openai.embeddings.create(
+            # The OpenAI client here is synchronous, so the request runs in a worker thread.
+            response = await asyncio.to_thread(
+                self._openai.embeddings.create,
                 model=OPENAI_EMBEDDING_MODEL,
                 input=text,
-                dimensions=OPENAI_EMBEDDING_DIM
+                dimensions=OPENAI_EMBEDDING_DIM,
             )
             return response.data[0].embedding
         except Exception as e:
             logging.error(f"Failed to generate OpenAI embedding: {e}")
             raise
 
-    async def query(self, text: str, limit: int = 5, 
+    async def query(self, text: str, limit: Optional[int] = DEFAULT_QUERY_LIMIT, 
                    filter_params: Optional[Dict[str, Any]] = None) -> List[Dict]:
         """Query Qdrant for similar tarot cards based on text."""
         if not self._client:
             raise ConnectionError("Qdrant client not initialized")
+        # /rag/query accepts an explicit null limit
+        if limit is None:
+            limit = DEFAULT_QUERY_LIMIT
 
         # Generate embedding for query text
         embedding = await self.generate_embedding(text)
-        
+
+        if self._vectors is not None:
+            return self._search_local(embedding, limit, filter_params)
+
         # Build filter if params provided
         search_filter = None
         if filter_params:
@@ -173,8 +268,9 @@ class RAGService:
             if conditions:
                 search_filter = Filter(must=conditions)
 
-        # Search in collection
-        search_result = self._client.search(
+        # Search in collection (the Qdrant client is synchronous: keep it off the event loop)
+        search_result = await asyncio.to_thread(
+            self._client.search,
             collection_name=COLLECTION_NAME,
             query_vector=embedding,
             limit=limit,
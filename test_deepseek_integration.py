@@ -25,15 +25,15 @@ if LLM_PROVIDER == "deepseek" and not DEEPSEEK_API_KEY:
     logger.warning("LLM 提供商設置為 DeepSeek，但未提供 API Key！")
 
 # 導入 Agent 函數
-from agents.langchain_agent import get_llm, invoke_agent
+from agents.langchain_agent import AGENT_MODEL, aclient, invoke_agent
 
 async def test_llm_provider():
     """測試當前配置的 LLM 提供商"""
     logger.info("獲取 LLM 提供商...")
-    llm = get_llm()
-    logger.info(f"使用的 LLM 提供商: {llm.__class__.__name__}")
+    provider = f"{AGENT_MODEL} @ {aclient.base_url}"
+    logger.info(f"使用的 LLM 提供商: {provider}")
     
-    return llm.__class__.__name__
+    return provider
 
 async def test_llm_response():
     """測試 LLM 回應"""
@@ -0,0 +1,10 @@
+"""Shared test setup: dummy credentials so the app and agent modules can be imported."""
+
+import os
+
+# Set before any application module is imported (they read the environment at import).
+os.environ.setdefault("DEEPSEEK_API_KEY", "test-key")
+os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "test-token")
+os.environ.setdefault("LINE_CHANNEL_SECRET", "test-secret")
+# Keep the conversation memory in-process.
+os.environ["REDIS_URL"] = ""
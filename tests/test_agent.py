@@ -0,0 +1,155 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from agents import langchain_agent, tools
+
+
+@pytest.mark.parametrize("text, tool_name", [
+    ("獅子座今天運勢如何", "HoroscopeProvider"),
+    ("幫我抽一張牌", "RandomTarotReader"),
+    ("抽三張牌", "RandomTarotReader"),
+    ("昨天抽到的死神牌是什麼意思", None),
+    ("抽出的牌是逆位嗎", None),
+    ("我今天心情不好", None),
+])
+def test_route_intent(text, tool_name):
+    tool = langchain_agent._route_intent(text)
+    assert (tool.name if tool else None) == tool_name
+
+
+@pytest.mark.parametrize("text, routed", [
+    ("獅子座今天運勢如何", True),
+    ("獅子座明天運氣好嗎", True),
+    ("獅子座明天適合告白嗎", False),
+    ("幫我抽一張牌", False),
+])
+def test_is_routed_horoscope(text, routed):
+    assert langchain_agent.is_routed_horoscope(text) is routed
+
+
+class FakeStream:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    async def _iterate(self):
+        for chunk in self.chunks:
+            await asyncio.sleep(0)
+            yield chunk
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_stream_holds_the_concurrency_slot_until_consumed(monkeypatch):
+    semaphore = asyncio.Semaphore(1)
+    streams = []
+
+    async def create(**kwargs):
+        assert kwargs["stream"] is True
+        streams.append(FakeStream([1, 2, 3]))
+        return streams[-1]
+
+    monkeypatch.setattr(tools, "_deepseek_sem", semaphore)
+    monkeypatch.setattr(tools.aclient.chat.completions, "create", create)
+
+    stream = tools.stream_chat_completion(model="deepseek-chat")
+    assert await stream.__anext__() == 1
+    assert semaphore.locked()
+
+    await stream.aclose()
+    assert not semaphore.locked()
+    assert streams[0].closed
+
+
+def text_chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+@pytest.mark.asyncio
+async def test_routed_horoscope_is_rewritten_by_the_model(monkeypatch):
+    requests = []
+
+    async def fetch(query):
+        return "獅子座", "A great day."
+
+    async def stream_chat_completion(**kwargs):
+        requests.append(kwargs)
+        for text in ("今天", "很棒"):
+            yield text_chunk(text)
+
+    monkeypatch.setattr(tools, "_fetch_horoscope", fetch)
+    monkeypatch.setattr(tools, "stream_chat_completion", stream_chat_completion)
+
+    reply = [delta async for delta in tools.stream_horoscope_reading("獅子座今天運勢")]
+
+    assert reply == ["今天", "很棒"]
+    assert "A great day." in requests[0]["messages"][-1]["content"]
+
+
+@pytest.mark.asyncio
+async def test_routed_horoscope_falls_back_to_the_prediction(monkeypatch):
+    async def fetch(query):
+        return "獅子座", "A great day."
+
+    async def failing_stream(**kwargs):
+        raise RuntimeError("down")
+        yield
+
+    monkeypatch.setattr(tools, "_fetch_horoscope", fetch)
+    monkeypatch.setattr(tools, "stream_chat_completion", failing_stream)
+
+    reply = [delta async for delta in tools.stream_horoscope_reading("獅子座今天運勢")]
+
+    assert reply == ["以下是 獅子座 今天的運勢分析：\n\nA great day."]
+
+
+@pytest.fixture
+def semantic_cache(monkeypatch):
+    from qdrant_client import AsyncQdrantClient
+
+    client = AsyncQdrantClient(":memory:")
+    monkeypatch.setattr(tools, "get_qdrant_client", lambda: client)
+    monkeypatch.setattr(tools, "_semantic_cache_ready", False)
+    monkeypatch.setattr(tools, "_semantic_cache_purged_at", 0.0)
+    return client
+
+
+@pytest.mark.asyncio
+async def test_semantic_cache_overwrites_repeated_queries(semantic_cache):
+    vector = (1.0, 0.0, 0.0)
+    assert await tools._semantic_cache_lookup(vector) is None
+
+    await tools._semantic_cache_store("query", vector, "first")
+    await tools._semantic_cache_store("query", vector, "second")
+
+    count = await semantic_cache.count(tools.TAROT_QUERY_CACHE_COLLECTION)
+    assert count.count == 1
+    assert await tools._semantic_cache_lookup(vector) == "second"
+
+
+@pytest.mark.asyncio
+async def test_semantic_cache_expires_and_purges_old_readings(semantic_cache):
+    vector = (1.0, 0.0, 0.0)
+    await tools._semantic_cache_lookup(vector)
+    await tools._semantic_cache_store("old", vector, "stale")
+    expired = time.time() - tools.SEMANTIC_CACHE_TTL_SECONDS - 1
+    await semantic_cache.set_payload(
+        tools.TAROT_QUERY_CACHE_COLLECTION,
+        {"created_at": expired},
+        points=[tools._semantic_cache_point_id("old")],
+    )
+    assert await tools._semantic_cache_lookup(vector) is None
+
+    tools._semantic_cache_purged_at = 0.0
+    await tools._semantic_cache_store("new", (0.0, 1.0, 0.0), "fresh")
+
+    count = await semantic_cache.count(tools.TAROT_QUERY_CACHE_COLLECTION)
+    assert count.count == 1
@@ -0,0 +1,125 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import app
+
+
+def text_event(user_id, text):
+    return SimpleNamespace(source=SimpleNamespace(user_id=user_id), message=SimpleNamespace(text=text))
+
+
+class FakeReplier:
+    def __init__(self):
+        self.parts = []
+
+    async def feed(self, delta):
+        self.parts.append(delta)
+
+    @property
+    def text(self):
+        return "".join(self.parts)
+
+
+@pytest.mark.asyncio
+async def test_text_events_are_sequential_per_user_and_concurrent_across_users(monkeypatch):
+    log = []
+
+    async def handle_text_message(event, line_bot_api):
+        log.append(("start", event.source.user_id, event.message.text))
+        await asyncio.sleep(0.01)
+        if event.message.text == "boom":
+            raise RuntimeError("boom")
+        log.append(("end", event.source.user_id, event.message.text))
+
+    monkeypatch.setattr(app, "handle_text_message", handle_text_message)
+    events = [text_event("a", "1"), text_event("b", "1"), text_event("a", "boom"), text_event("a", "3")]
+
+    await app.handle_text_events(events, None)
+
+    user_a = [entry for entry in log if entry[1] == "a"]
+    # A failing message does not stop the user's later messages.
+    assert user_a == [("start", "a", "1"), ("end", "a", "1"), ("start", "a", "boom"), ("start", "a", "3"), ("end", "a", "3")]
+    # User b started before user a's first message finished.
+    assert log.index(("start", "b", "1")) < log.index(("end", "a", "1"))
+
+
+@pytest.fixture
+def fake_agent(monkeypatch):
+    """Replace the agent with a counting stub and record the turns saved on cache hits."""
+    calls = []
+    remembered = []
+
+    async def stream_agent(user_id, text_message):
+        calls.append(text_message)
+        await asyncio.sleep(0.01)
+        yield f"reply {len(calls)}"
+
+    async def remember_turn(user_id, text_message, reply):
+        remembered.append((user_id, text_message, reply))
+
+    monkeypatch.setattr(app, "stream_agent", stream_agent)
+    monkeypatch.setattr(app, "remember_turn", remember_turn)
+    monkeypatch.setattr(app, "agent_reply_cache", app.LRUCache(maxsize=16, ttl=60))
+    return calls, remembered
+
+
+@pytest.mark.asyncio
+async def test_non_cacheable_messages_always_run_the_agent(fake_agent):
+    calls, remembered = fake_agent
+    first, second = FakeReplier(), FakeReplier()
+
+    await app.stream_agent_reply(first, "user", "抽一張牌")
+    await app.stream_agent_reply(second, "user", "抽一張牌")
+
+    assert calls == ["抽一張牌", "抽一張牌"]
+    assert (first.text, second.text) == ("reply 1", "reply 2")
+    assert remembered == []
+
+
+@pytest.mark.asyncio
+async def test_cache_hit_reuses_the_reply_and_saves_the_turn(fake_agent):
+    calls, remembered = fake_agent
+    first, second = FakeReplier(), FakeReplier()
+
+    await app.stream_agent_reply(first, "user", "獅子座 運勢", cacheable=True)
+    await app.stream_agent_reply(second, "user", "獅子座  運勢", cacheable=True)
+
+    assert calls == ["獅子座 運勢"]
+    assert second.text == "reply 1"
+    assert remembered == [("user", "獅子座  運勢", "reply 1")]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicates_share_one_agent_run(fake_agent):
+    calls, remembered = fake_agent
+    first, second = FakeReplier(), FakeReplier()
+
+    await asyncio.gather(
+        app.stream_agent_reply(first, "user", "獅子座運勢", cacheable=True),
+        app.stream_agent_reply(second, "user", "獅子座運勢", cacheable=True),
+    )
+
+    assert calls == ["獅子座運勢"]
+    assert first.text == second.text == "reply 1"
+    assert remembered == [("user", "獅子座運勢", "reply 1")]
+
+
+@pytest.mark.asyncio
+async def test_empty_reply_is_not_cached(monkeypatch, fake_agent):
+    calls, _ = fake_agent
+
+    async def silent_agent(user_id, text_message):
+        calls.append(text_message)
+        return
+        yield
+
+    monkeypatch.setattr(app, "stream_agent", silent_agent)
+    replier = FakeReplier()
+
+    await app.stream_agent_reply(replier, "user", "獅子座運勢", cacheable=True)
+    await app.stream_agent_reply(FakeReplier(), "user", "獅子座運勢", cacheable=True)
+
+    assert replier.text == app.AGENT_FALLBACK_REPLY
+    assert len(calls) == 2
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from core import cache as cache_module
+from core.cache import LRUCache, SingleFlight
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_lru_cache_entries_expire_after_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    cache = LRUCache(maxsize=10, ttl=60)
+    cache.set("a", 1)
+
+    now[0] = 159.0
+    assert cache.get("a") == 1
+    now[0] = 160.0
+    assert "a" not in cache
+    assert cache.get("a", "missing") == "missing"
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_single_flight_coalesces_concurrent_calls():
+    flights = SingleFlight()
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    results = await asyncio.gather(*(flights.do("key", work) for _ in range(5)))
+
+    assert results == [1] * 5
+    assert calls == 1
+    assert len(flights) == 0
+    # The key is released once the task finishes: a later call runs again.
+    assert await flights.do("key", work) == 2
+
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_exceptions():
+    flights = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    results = await asyncio.gather(
+        flights.do("key", fail), flights.do("key", fail), return_exceptions=True
+    )
+
+    assert all(isinstance(result, RuntimeError) for result in results)
@@ -0,0 +1,101 @@
+import pytest
+from linebot.v3.messaging import TextMessage
+
+from ui import line_stream
+from ui.line_stream import FLUSH_MAX_CHARS, FLUSH_MIN_CHARS, LineStreamReplier
+
+
+class FakeMessagingApi:
+    """Records reply/push requests; fails the calls whose numbers are in `fail_calls`."""
+
+    def __init__(self, fail_calls=()):
+        self.requests = []
+        self.fail_calls = set(fail_calls)
+
+    async def _send(self, kind, request):
+        self.requests.append((kind, [message.text for message in request.messages]))
+        if len(self.requests) in self.fail_calls:
+            raise RuntimeError("network error")
+
+    async def reply_message(self, request):
+        await self._send("reply", request)
+
+    async def push_message(self, request):
+        await self._send("push", request)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(line_stream.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.mark.asyncio
+async def test_flushes_at_sentence_end_after_min_chars_and_interval(clock):
+    api = FakeMessagingApi()
+    replier = LineStreamReplier(api, "token", "user")
+    sentence = "a" * (FLUSH_MIN_CHARS - 1) + "。"
+
+    await replier.feed(sentence)
+    await replier.feed("下一句。")
+    # Long enough and at a sentence end, but too soon after the start.
+    assert api.requests == []
+
+    clock[0] += 10
+    await replier.feed("還沒結束")
+    # The newest delta always stays buffered for the final message.
+    assert api.requests == [("reply", [sentence + "下一句。"])]
+
+
+@pytest.mark.asyncio
+async def test_forces_a_flush_at_max_chars(clock):
+    api = FakeMessagingApi()
+    replier = LineStreamReplier(api, "token", "user")
+
+    await replier.feed("a" * FLUSH_MAX_CHARS)
+    await replier.feed("b")
+
+    assert api.requests == [("reply", ["a" * FLUSH_MAX_CHARS])]
+
+
+@pytest.mark.asyncio
+async def test_reply_token_is_used_once_then_push(clock):
+    api = FakeMessagingApi()
+    replier = LineStreamReplier(api, "token", "user")
+    sentence = "a" * FLUSH_MIN_CHARS + "。"
+
+    clock[0] += 10
+    await replier.feed(sentence)
+    await replier.feed("end")
+    text = await replier.finish(extra_messages=[TextMessage(text="buttons")])
+
+    assert api.requests == [("reply", [sentence]), ("push", ["end", "buttons"])]
+    assert text == sentence + "end"
+
+
+@pytest.mark.asyncio
+async def test_failed_text_is_resent_with_the_next_message(clock):
+    api = FakeMessagingApi(fail_calls={1})
+    replier = LineStreamReplier(api, "token", "user")
+    sentence = "a" * FLUSH_MIN_CHARS + "。"
+
+    clock[0] += 10
+    await replier.feed(sentence)
+    await replier.feed("end")
+    await replier.finish()
+
+    assert api.requests == [("reply", [sentence]), ("push", [sentence + "end"])]
+
+
+@pytest.mark.asyncio
+async def test_pending_tail_is_capped(clock):
+    api = FakeMessagingApi(fail_calls={1})
+    replier = LineStreamReplier(api, "token", "user")
+
+    await replier.feed("a" * FLUSH_MAX_CHARS)
+    await replier.feed("end")
+    await replier.finish()
+
+    resent = api.requests[1][1][0]
+    assert resent == "a" * line_stream.PENDING_TAIL_MAX_CHARS + "end"
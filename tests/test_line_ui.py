@@ -0,0 +1,40 @@
+import pytest
+
+from ui.line_ui import check_for_zodiac_sign, match_keyword_tags, menu_type_from_tags
+
+
+def test_horoscope_query_is_tagged():
+    assert {"zodiac_sign", "fortune"} <= match_keyword_tags("獅子座明天運勢如何")
+
+
+@pytest.mark.parametrize("text", ["leopard 今天好累", "cancer research 今天", "Aries-like 明天", "Leo 今天"])
+def test_english_words_are_not_zodiac_signs(text):
+    assert "zodiac_sign" not in match_keyword_tags(text)
+
+
+@pytest.mark.parametrize("text, menu_type", [
+    ("選單", "main_menu"),
+    ("HELP me", "main_menu"),
+    ("我想抽牌", "tarot_menu"),
+    ("今日運勢", "daily_fortune"),
+    ("星座", "horoscope_menu"),
+    ("記錄心情", "mood_diary"),
+    ("helpful advice", None),
+    ("你好", None),
+])
+def test_menu_type(text, menu_type):
+    assert menu_type_from_tags(match_keyword_tags(text)) == menu_type
+
+
+def test_keyword_tags_include_shorter_contained_keywords():
+    # 今日運勢 contains 運勢, so one match yields both tags.
+    assert {"daily_fortune", "fortune", "horoscope_topic"} <= match_keyword_tags("今日運勢")
+
+
+@pytest.mark.parametrize("text, sign", [
+    ("我是Leo座", "獅子座"),
+    ("天蠍座的個性", "天蠍座"),
+    ("leopard", None),
+])
+def test_check_for_zodiac_sign(text, sign):
+    assert check_for_zodiac_sign(text) == sign
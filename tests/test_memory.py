@@ -0,0 +1,81 @@
+import pytest
+from langchain_community.chat_message_histories import RedisChatMessageHistory
+
+from agents.memory import ExpandingWindowMemory
+
+
+class FakeRedis:
+    """The subset of the redis client RedisChatMessageHistory and the window snap use."""
+
+    def __init__(self):
+        self.lists = {}
+        self.trims = []
+
+    def lpush(self, key, value):
+        self.lists.setdefault(key, []).insert(0, value.encode())
+
+    def expire(self, key, ttl):
+        pass
+
+    def lrange(self, key, start, end):
+        return list(self.lists.get(key, []))
+
+    def llen(self, key):
+        return len(self.lists.get(key, []))
+
+    def ltrim(self, key, start, end):
+        self.trims.append((key, start, end))
+        self.lists[key] = self.lists[key][start:end + 1]
+
+    def delete(self, key):
+        raise AssertionError("the window snap must not clear the Redis list")
+
+
+def redis_history(client):
+    history = RedisChatMessageHistory.__new__(RedisChatMessageHistory)
+    history.redis_client = client
+    history.session_id = "user"
+    history.key_prefix = "message_store:"
+    history.ttl = None
+    return history
+
+
+async def save_turns(memory, turns):
+    sizes = []
+    for i in range(turns):
+        await memory.asave_context({"input": f"q{i}"}, {"output": f"a{i}"})
+        sizes.append(len((await memory.aload_memory_variables({}))["chat_history"]))
+    return sizes
+
+
+@pytest.mark.asyncio
+async def test_window_grows_to_2k_turns_then_snaps_to_k():
+    memory = ExpandingWindowMemory(k=2, return_messages=True)
+
+    sizes = await save_turns(memory, 6)
+
+    # Messages per turn: 2. The window reaches 2k turns (8 messages) and keeps the latest k.
+    assert sizes == [2, 4, 6, 4, 6, 4]
+    messages = (await memory.aload_memory_variables({}))["chat_history"]
+    assert [message.content for message in messages] == ["q4", "a4", "q5", "a5"]
+
+
+@pytest.mark.asyncio
+async def test_redis_window_is_trimmed_with_one_ltrim():
+    client = FakeRedis()
+    memory = ExpandingWindowMemory(k=2, return_messages=True, chat_memory=redis_history(client))
+
+    sizes = await save_turns(memory, 6)
+
+    assert sizes == [2, 4, 6, 4, 6, 4]
+    assert client.trims == [("message_store:user", 0, 3), ("message_store:user", 0, 3)]
+    messages = (await memory.aload_memory_variables({}))["chat_history"]
+    assert [message.content for message in messages] == ["q4", "a4", "q5", "a5"]
+
+
+def test_sync_save_context_snaps_the_window():
+    memory = ExpandingWindowMemory(k=1, return_messages=False)
+    for i in range(2):
+        memory.save_context({"input": f"q{i}"}, {"output": f"a{i}"})
+
+    assert memory.load_memory_variables({})["chat_history"] == "Human: q1\nAI: a1"
@@ -0,0 +1,56 @@
+import pytest
+
+from core import ratelimit
+from core.ratelimit import AsyncRateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A fake monotonic clock that asyncio.sleep advances instantly."""
+    now = [0.0]
+    sleeps = []
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(ratelimit.asyncio, "sleep", fake_sleep)
+    return now, sleeps
+
+
+@pytest.mark.asyncio
+async def test_burst_up_to_max_rate_does_not_wait(clock):
+    _, sleeps = clock
+    limiter = AsyncRateLimiter(max_rate=3, time_period=60)
+    for _ in range(3):
+        async with limiter:
+            pass
+    assert sleeps == []
+
+
+@pytest.mark.asyncio
+async def test_waits_for_the_bucket_to_refill(clock):
+    now, sleeps = clock
+    limiter = AsyncRateLimiter(max_rate=3, time_period=60)
+    for _ in range(3):
+        await limiter.acquire()
+
+    # One token refills every 20 seconds.
+    await limiter.acquire()
+    assert sleeps == [pytest.approx(20)]
+    assert now[0] == pytest.approx(20)
+
+
+@pytest.mark.asyncio
+async def test_refill_is_capped_at_max_rate(clock):
+    now, sleeps = clock
+    limiter = AsyncRateLimiter(max_rate=2, time_period=60)
+    await limiter.acquire()
+    now[0] += 3600
+
+    for _ in range(2):
+        await limiter.acquire()
+    assert sleeps == []
+    await limiter.acquire()
+    assert sleeps == [pytest.approx(30)]
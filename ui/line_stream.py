@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+LINE 串流回覆模組
+
+此模組負責將 Agent 串流產生的文字片段轉送到 LINE：
+- 累積 token，達到字數與時間門檻並遇到句子結尾時才送出 (debounce)
+- 第一段使用 reply token 回覆 (免費、只能使用一次)，之後的段落改用 push 訊息
+- 最後一段可附帶額外的 UI 訊息 (例如塔羅按鈕) 與快速回覆
+- 送出失敗的文字保留在 pending tail，附加在下一則訊息前面重送，
+  避免行動網路不穩時回覆中間出現缺漏 (Eloquent 式重送)
+"""
+import logging
+import time
+from typing import List, Optional, Sequence
+
+from linebot.v3.messaging import (
+    AsyncMessagingApi,
+    PushMessageRequest,
+    QuickReply,
+    ReplyMessageRequest,
+    TextMessage,
+)
+
+# 一次送出前至少要累積的字數
+FLUSH_MIN_CHARS = 120
+# 兩次送出之間至少間隔的秒數
+FLUSH_INTERVAL_SECONDS = 1.5
+# 超過此字數時不論是否在句尾都強制送出 (LINE 文字訊息上限為 5000 字)
+FLUSH_MAX_CHARS = 2000
+# 視為句子結尾的字元
+SENTENCE_ENDINGS = ("。", "！", "？", "!", "?", "\n")
+# LINE 單次 reply/push 最多可帶 5 則訊息
+MAX_MESSAGES_PER_REQUEST = 5
+# 尚未確認送達、需要重送的文字上限 (保留最新的部分，避免超過 LINE 的 5000 字限制)
+PENDING_TAIL_MAX_CHARS = 500
+
+
+class LineStreamReplier:
+    """將串流文字片段分段轉送給 LINE 使用者。"""
+
+    def __init__(self, line_bot_api: AsyncMessagingApi, reply_token: str, user_id: str) -> None:
+        self._line_bot_api = line_bot_api
+        self._reply_token: Optional[str] = reply_token
+        self._user_id = user_id
+        self._buffer: List[str] = []
+        self._parts: List[str] = []
+        # 送出失敗、尚未確認送達的文字
+        self._pending_tail: List[str] = []
+        self._last_flush = time.monotonic()
+
+    @property
+    def text(self) -> str:
+        """目前為止收到的完整回覆文字。"""
+        return "".join(self._parts).strip()
+
+    async def feed(self, delta: str) -> None:
+        """
+        接收一段新的文字片段，必要時送出已累積的內容
+
+        最新的片段永遠保留在緩衝區中，確保最後一則訊息一定有文字可以附帶快速回覆。
+
+        Args:
+            delta (str): Agent 新產生的文字片段
+        """
+        if not delta:
+            return
+        self._parts.append(delta)
+        self._buffer.append(delta)
+
+        pending = "".join(self._buffer[:-1])
+        if not pending.strip():
+            return
+        if len(pending) >= FLUSH_MAX_CHARS or (
+            len(pending) >= FLUSH_MIN_CHARS
+            and pending.endswith(SENTENCE_ENDINGS)
+            and time.monotonic() - self._last_flush >= FLUSH_INTERVAL_SECONDS
+        ):
+            self._buffer = self._buffer[-1:]
+            await self._send_text(pending)
+
+    async def finish(
+        self,
+        extra_messages: Sequence = (),
+        quick_reply: Optional[QuickReply] = None,
+    ) -> str:
+        """
+        送出剩餘的文字與額外的 UI 訊息
+
+        Args:
+            extra_messages: 附加在最後一段文字之後的訊息 (例如按鈕模板)
+            quick_reply (Optional[QuickReply]): 附加在最後一段文字上的快速回覆
+
+        Returns:
+            str: 完整的回覆文字
+        """
+        remaining = "".join(self._buffer)
+        self._buffer = []
+        if remaining.strip() or self._pending_tail or extra_messages:
+            await self._send_text(remaining, extra_messages, quick_reply)
+        if self._pending_tail:
+            logging.error("LINE 最後一則訊息送出失敗，使用者 %s 的回覆不完整", self._user_id)
+        return self.text
+
+    async def _send_text(
+        self,
+        text: str,
+        extra_messages: Sequence = (),
+        quick_reply: Optional[QuickReply] = None,
+    ) -> None:
+        """
+        送出一段文字，並在前面附加先前送出失敗的文字
+
+        送出成功時清空 pending tail；失敗時把這段文字加入 pending tail，
+        讓下一則訊息一併重送，而不是讓錯誤中斷整個串流。
+
+        Args:
+            text (str): 要送出的新文字
+            extra_messages: 附加在文字之後的訊息 (例如按鈕模板)
+            quick_reply (Optional[QuickReply]): 附加在文字上的快速回覆
+        """
+        full_text = ("".join(self._pending_tail) + text).strip()
+        messages = []
+        if full_text:
+            messages.append(TextMessage(text=full_text, quick_reply=quick_reply))
+        messages.extend(extra_messages)
+        if not messages:
+            return
+        try:
+            await self.send(messages[:MAX_MESSAGES_PER_REQUEST])
+        except Exception as e:
+            logging.warning("LINE 訊息送出失敗，保留 %d 字待下次重送: %s", len(full_text), e)
+            self._pending_tail = [full_text[-PENDING_TAIL_MAX_CHARS:]]
+        else:
+            self._pending_tail = []
+
+    async def send(self, messages: list) -> None:
+        """
+        送出訊息：reply token 尚未使用時使用 reply，否則改用 push
+
+        Args:
+            messages (list): 要送出的 LINE 訊息
+        """
+        if self._reply_token:
+            reply_token, self._reply_token = self._reply_token, None
+            await self._line_bot_api.reply_message(
+                ReplyMessageRequest(reply_token=reply_token, messages=messages)
+            )
+        else:
+            await self._line_bot_api.push_message(
+                PushMessageRequest(to=self._user_id, messages=messages)
+            )
+        self._last_flush = time.monotonic()
@@ -13,7 +13,8 @@ LINE Bot UI 模組
 """
 import os
 import json
-from typing import Dict, List, Any, Optional
+import re
+from typing import Dict, FrozenSet, List, Any, Optional
 from linebot.v3.messaging import (
     QuickReply,
     QuickReplyItem,
@@ -36,6 +37,29 @@ HOROSCOPE_SIGNS = {
     "摩羯座": "Capricorn", "水瓶座": "Aquarius", "雙魚座": "Pisces"
 }
 
+
+
+def _keyword_regex(keyword: str) -> str:
+    """
+    將關鍵字轉成正規表示式片段
+
+    英文關鍵字必須是完整的單字 ("leo" 不會比對到 "leopard")；中文沒有分詞，直接比對子字串。
+    不使用 \\b：中文字也算是單字字元，"Leo座" 之間沒有 \\b。
+    """
+    escaped = re.escape(keyword)
+    if keyword.isascii():
+        return rf"(?<![a-z]){escaped}(?![a-z])"
+    return escaped
+
+
+# 預先編譯的星座名稱比對 (中文、英文名稱合併成一個)，一次掃描即可找出星座
+# 中文名稱排在前面，同一位置同時符合時以中文為準
+ZODIAC_NAME_TO_CH = {
+    **{sign_ch: sign_ch for sign_ch in HOROSCOPE_SIGNS},
+    **{sign_en.lower(): sign_ch for sign_ch, sign_en in HOROSCOPE_SIGNS.items()},
+}
+ZODIAC_SIGN_PATTERN = re.compile("|".join(map(_keyword_regex, ZODIAC_NAME_TO_CH)), re.IGNORECASE)
+
 # 星座對應表情符號
 ZODIAC_EMOJI = {
     "白羊座": "♈", "金牛座": "♉", "雙子座": "♊",
@@ -716,6 +740,102 @@ def create_horoscope_menu_flex() -> FlexMessage:
     
     return FlexMessage(alt_text="星座運勢選單", contents=flex_json)
 
+
+# === 預先建立的靜態訊息 ===
+# 以下選單內容與使用者無關，匯入時建立一次後重複使用，
+# 省去每則訊息重新組合巢狀 Flex JSON 與模型驗證的成本 (傳送時 SDK 只會讀取、不會修改)
+MAIN_MENU_MESSAGE = create_main_menu_flex()
+TAROT_BUTTONS_MESSAGE = create_tarot_buttons()
+HOROSCOPE_MENU_MESSAGE = create_horoscope_menu_flex()
+DAILY_FORTUNE_MESSAGE = create_daily_fortune_flex()
+MOOD_DIARY_MESSAGE = create_mood_diary_flex()
+ZODIAC_QUICK_REPLY = create_zodiac_quick_reply()
+
+# 選單類型 (見 MENU_KEYWORDS) 對應的選單訊息
+MENU_MESSAGES = {
+    "main_menu": MAIN_MENU_MESSAGE,
+    "tarot_menu": TAROT_BUTTONS_MESSAGE,
+    "horoscope_menu": HOROSCOPE_MENU_MESSAGE,
+    "daily_fortune": DAILY_FORTUNE_MESSAGE,
+    "mood_diary": MOOD_DIARY_MESSAGE,
+}
+
+# === 關鍵字比對 ===
+
+# 選單類型與其關鍵字，依優先順序排列 (同時符合多個選單時取最前面的)
+MENU_KEYWORDS = {
+    "main_menu": ["選單", "功能", "menu", "幫助", "說明", "help"],
+    "tarot_menu": ["塔羅", "tarot", "占卜", "抽牌"],
+    "horoscope_menu": ["星座", "horoscope", "zodiac"],
+    "daily_fortune": ["今日運勢", "每日運勢", "今天運勢", "daily fortune"],
+    "mood_diary": ["心情日記", "記錄心情", "情緒日記", "mood diary", "心情記錄"],
+}
+
+# 所有關鍵字分類：選單，加上訊息處理與回覆按鈕使用的分類
+KEYWORD_TAGS = {
+    **MENU_KEYWORDS,
+    # 星座名稱：只比對中文，英文的 "cancer"、"leo" 常是一般用字，加上「今天」就會被誤判為運勢查詢
+    "zodiac_sign": list(HOROSCOPE_SIGNS),
+    # 詢問運勢的字詞
+    "fortune": ["運勢", "今天", "明天", "運氣"],
+    # 回覆內容提到塔羅 / 星座時附加對應的按鈕
+    "tarot_topic": ["塔羅牌", "占卜", "抽牌", "tarot"],
+    "horoscope_topic": ["星座", "運勢", "horoscope", "zodiac"],
+}
+
+
+def _build_keyword_index(keyword_tags: Dict[str, List[str]]):
+    """
+    將所有分類的關鍵字編譯成一個正規表示式，並建立關鍵字到分類的對照表
+
+    正規表示式包在 lookahead 中並由長到短排列，finditer 會在每個位置回報最長的關鍵字
+    (可互相重疊)；每個關鍵字的分類也包含所有被它包含的較短關鍵字的分類，
+    因此掃描一次就能找出文字中出現的所有分類。英文關鍵字只比對完整的單字。
+    """
+    keywords = {keyword.lower() for keywords in keyword_tags.values() for keyword in keywords}
+    tags_by_keyword = {
+        keyword: frozenset(
+            tag
+            for tag, tag_keywords in keyword_tags.items()
+            if any(other.lower() in keyword for other in tag_keywords)
+        )
+        for keyword in keywords
+    }
+    alternation = "|".join(map(_keyword_regex, sorted(keywords, key=len, reverse=True)))
+    return re.compile(f"(?=({alternation}))", re.IGNORECASE), tags_by_keyword
+
+
+_KEYWORD_PATTERN, _TAGS_BY_KEYWORD = _build_keyword_index(KEYWORD_TAGS)
+
+
+def match_keyword_tags(text: str) -> FrozenSet[str]:
+    """
+    掃描一次文字，找出其中出現的所有關鍵字分類 (KEYWORD_TAGS 的鍵)
+
+    Args:
+        text (str): 使用者輸入或 AI 回覆的文字
+
+    Returns:
+        FrozenSet[str]: 出現的分類，例如 {"zodiac_sign", "fortune"}
+    """
+    return frozenset().union(
+        *(_TAGS_BY_KEYWORD[match.group(1).lower()] for match in _KEYWORD_PATTERN.finditer(text))
+    )
+
+
+def menu_type_from_tags(tags: FrozenSet[str]) -> Optional[str]:
+    """
+    依優先順序從關鍵字分類中挑出選單類型
+
+    Args:
+        tags (FrozenSet[str]): match_keyword_tags 的結果
+
+    Returns:
+        Optional[str]: 對應的選單類型，沒有符合時返回 None
+    """
+    return next((menu_type for menu_type in MENU_KEYWORDS if menu_type in tags), None)
+
+
 # 建立處理使用者輸入的輔助函數
 def check_for_menu_keywords(text: str) -> Optional[str]:
     """
@@ -727,29 +847,7 @@ def check_for_menu_keywords(text: str) -> Optional[str]:
     Returns:
         Optional[str]: 如果包含關鍵字，返回對應的選單類型，否則返回 None
     """
-    text = text.lower()
-    
-    # 檢查主選單關鍵字
-    if any(keyword in text for keyword in ["選單", "功能", "menu", "幫助", "說明", "help"]):
-        return "main_menu"
-    
-    # 檢查塔羅牌關鍵字
-    elif any(keyword in text for keyword in ["塔羅", "tarot", "占卜", "抽牌"]):
-        return "tarot_menu"
-    
-    # 檢查星座關鍵字
-    elif any(keyword in text for keyword in ["星座", "horoscope", "zodiac"]):
-        return "horoscope_menu"
-        
-    # 檢查每日運勢關鍵字
-    elif any(keyword in text for keyword in ["今日運勢", "每日運勢", "今天運勢", "daily fortune"]):
-        return "daily_fortune"
-        
-    # 檢查心情日記關鍵字
-    elif any(keyword in text for keyword in ["心情日記", "記錄心情", "情緒日記", "mood diary", "心情記錄"]):
-        return "mood_diary"
-    
-    return None
+    return menu_type_from_tags(match_keyword_tags(text))
 
 
 def check_for_zodiac_sign(text: str) -> Optional[str]:
@@ -762,15 +860,7 @@ def check_for_zodiac_sign(text: str) -> Optional[str]:
     Returns:
         Optional[str]: 如果包含星座名稱，返回星座名稱，否則返回 None
     """
-    text = text.lower()
-    
-    for zodiac_sign in HOROSCOPE_SIGNS.keys():
-        if zodiac_sign.lower() in text:
-            return zodiac_sign
-            
-    # 檢查英文星座名稱
-    for zodiac_ch, zodiac_en in HOROSCOPE_SIGNS.items():
-        if zodiac_en.lower() in text:
-            return zodiac_ch
-            
+    match = ZODIAC_SIGN_PATTERN.search(text)
+    if match:
+        return ZODIAC_NAME_TO_CH[match.group(0).lower()]
     return None